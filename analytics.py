@@ -0,0 +1,137 @@
+# analytics.py
+import os, threading
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, List, Iterable, Union
+
+ANALYTICS_BUCKET_SECONDS = int(os.getenv("ANALYTICS_BUCKET_SECONDS", "300"))
+ANALYTICS_PAGE_SIZE = int(os.getenv("ANALYTICS_PAGE_SIZE", "5000"))
+
+
+def _epoch(ts: Union[str, datetime, None]) -> float:
+    if ts is None:
+        return datetime.now(timezone.utc).timestamp()
+    if isinstance(ts, str):
+        ts = datetime.fromisoformat(ts)
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.timestamp()
+
+
+def _iso(epoch: float) -> str:
+    return datetime.fromtimestamp(epoch, timezone.utc).isoformat()
+
+
+class AttendanceRollups:
+    """
+    Time-bucketed counts of attendance_logs rows, per event type, plus the set of participants seen per event type.
+    add() keeps them current as scans are logged; rebuild() recomputes everything in one pass over the table.
+    Queries only read these aggregates, so they cost the same whatever the number of log rows.
+    """
+
+    def __init__(self, event_types: Iterable[str], bucket_seconds: int = ANALYTICS_BUCKET_SECONDS,
+                 page_size: int = ANALYTICS_PAGE_SIZE):
+        self.event_types = tuple(event_types)
+        self.bucket_seconds = bucket_seconds
+        self.page_size = page_size
+        self._lock = threading.Lock()
+        self._counts: Counter = Counter()  # (bucket index, event_type) -> scans
+        self._seen: Dict[str, set] = {e: set() for e in self.event_types}
+        self.rows = 0
+        # rows added while a rebuild is reading the table, re-applied on top of its result
+        self._pending: Optional[List[tuple]] = None
+        self.rebuilt_at: Optional[str] = None
+        self.rebuilding = False
+
+    # ---------------- Updates ----------------
+    def add(self, event_type: str, participant_id: str, timestamp: Union[str, datetime, None] = None):
+        entry = (int(_epoch(timestamp) // self.bucket_seconds), event_type, participant_id)
+        with self._lock:
+            self._apply(entry)
+            if self._pending is not None:
+                self._pending.append(entry)
+
+    def _apply(self, entry: tuple):
+        bucket, event_type, participant_id = entry
+        self._counts[(bucket, event_type)] += 1
+        self._seen.setdefault(event_type, set()).add(participant_id)
+        self.rows += 1
+
+    def rebuild(self, client):
+        """Re-reads attendance_logs page by page and replaces the rollups; sync, run it off the event loop."""
+        with self._lock:
+            if self._pending is not None:
+                return
+            self._pending = []
+            self.rebuilding = True
+        try:
+            counts, seen, rows, start = Counter(), {e: set() for e in self.event_types}, 0, 0
+            while True:
+                page = (client.table("attendance_logs").select("participant_id,event_type,timestamp")
+                        .order("id").range(start, start + self.page_size - 1).execute().data or [])
+                counts.update((int(_epoch(r["timestamp"]) // self.bucket_seconds), r["event_type"]) for r in page)
+                for r in page:
+                    seen.setdefault(r["event_type"], set()).add(r["participant_id"])
+                rows += len(page)
+                if len(page) < self.page_size:
+                    break
+                start += self.page_size
+        except Exception:
+            with self._lock:
+                self._pending, self.rebuilding = None, False
+            raise
+
+        with self._lock:
+            pending, self._pending = self._pending, None
+            self._counts, self._seen, self.rows = counts, seen, rows
+            # scans logged during the read: in the table already (single scans) or still in the spool;
+            # re-applying them can count a handful twice, dropping them would lose them until the next rebuild
+            for entry in pending:
+                self._apply(entry)
+            self.rebuilt_at = datetime.utcnow().isoformat()
+            self.rebuilding = False
+
+    # ---------------- Queries ----------------
+    def report(self, bucket_seconds: Optional[int] = None, since: Optional[datetime] = None,
+               until: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        series: scans per event type per bucket (bucket_seconds is rounded to a multiple of the stored bucket),
+        peaks: busiest bucket per event type, funnel: participants who reached one step but not another.
+        """
+        step = max(1, round((bucket_seconds or self.bucket_seconds) / self.bucket_seconds))
+        lo = _epoch(since) // self.bucket_seconds if since else None
+        hi = _epoch(until) // self.bucket_seconds if until else None
+        with self._lock:
+            merged: Dict[int, Counter] = {}
+            for (bucket, event_type), n in self._counts.items():
+                if (lo is not None and bucket < lo) or (hi is not None and bucket > hi):
+                    continue
+                merged.setdefault(bucket // step, Counter())[event_type] += n
+            rows = self.rows
+            checkin, boarding, meal = (self._seen.get(e, set()) for e in ("checkin", "boarding", "meal"))
+            funnel = {
+                "checked_in": len(checkin),
+                "boarded": len(boarding),
+                "ate": len(meal),
+                "boarded_not_checked_in": len(boarding - checkin),
+                "checked_in_not_boarded": len(checkin - boarding),
+                "checked_in_no_meal": len(checkin - meal),
+            }
+
+        width = step * self.bucket_seconds
+        series = [{"start": _iso(b * width), **{e: merged[b].get(e, 0) for e in self.event_types}} for b in sorted(merged)]
+        peaks = {}
+        for e in self.event_types:
+            best = max(series, key=lambda s: s[e], default=None)
+            if best and best[e]:
+                peaks[e] = {"start": best["start"], "scans": best[e], "per_minute": round(best[e] * 60 / width, 2)}
+        return {
+            "bucket_seconds": width,
+            "rows": rows,
+            "rebuilt_at": self.rebuilt_at,
+            "series": series,
+            "peaks": peaks,
+            "totals": {e: sum(s[e] for s in series) for e in self.event_types},
+            # over the whole event, whatever since/until say
+            "funnel": funnel,
+        }
@@ -0,0 +1,266 @@
+# attendance_spool.py
+import os, json, uuid, asyncio, threading
+from contextlib import contextmanager
+from typing import Dict, Any, List, Union, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, so run a single API process there
+    fcntl = None
+
+ATTENDANCE_SPOOL_PATH = os.getenv("ATTENDANCE_SPOOL_PATH", os.path.join("spool", "attendance.jsonl"))
+ATTENDANCE_FLUSH_SECONDS = float(os.getenv("ATTENDANCE_FLUSH_SECONDS", "2"))
+ATTENDANCE_FLUSH_BATCH = int(os.getenv("ATTENDANCE_FLUSH_BATCH", "500"))
+ATTENDANCE_SPOOL_FSYNC = os.getenv("ATTENDANCE_SPOOL_FSYNC", "1") == "1"
+
+
+def rejected(error: Exception) -> bool:
+    """The database refused the data itself (SQLSTATE class 22/23), so retrying the same row cannot succeed."""
+    return str(getattr(error, "code", None) or "")[:2] in ("22", "23")
+
+
+class AttendanceSpool:
+    """
+    Write-behind buffer for attendance_logs.
+    append() writes rows to a local append-only JSON-lines file and returns; a background task inserts
+    them in bulk. The byte offset of the last committed row is kept in <spool>.offset, so rows that were
+    not flushed before a crash or restart are replayed on the next start. Every row carries an event_id,
+    so a batch that is replayed after the insert succeeded is not inserted twice.
+    Rows the database rejects (e.g. a participant deleted since the scan) are moved to <spool>.dead so
+    they cannot hold up the rows behind them; any other error leaves the batch in place for the next flush.
+
+    Every API worker process (uvicorn --workers N) shares the spool: appends, reads and commits hold an
+    flock on <spool>.lock, and only the process holding <spool>.flush flushes, so no worker commits an
+    offset into rows another one is still inserting or truncates rows appended after its size check.
+    """
+
+    def __init__(self, path: str = ATTENDANCE_SPOOL_PATH, flush_seconds: float = ATTENDANCE_FLUSH_SECONDS,
+                 batch_size: int = ATTENDANCE_FLUSH_BATCH, fsync: bool = ATTENDANCE_SPOOL_FSYNC):
+        self.path = path
+        self.offset_path = path + ".offset"
+        self.dead_path = path + ".dead"
+        self.lock_path = path + ".lock"
+        self.flush_lock_path = path + ".flush"
+        self.flush_seconds = flush_seconds
+        self.batch_size = batch_size
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._lock_file = None
+        self._task: Optional[asyncio.Task] = None
+        self._client = None
+        self.flushed = 0
+        self.failures = 0
+        self.dead = 0
+        self.last_error: Optional[str] = None
+
+    # ---------------- Hot path ----------------
+    def append(self, rows: Union[Dict[str, Any], List[Dict[str, Any]]]):
+        if isinstance(rows, dict):
+            rows = [rows]
+        if not rows:
+            return
+        lines = []
+        for row in rows:
+            row = dict(row)
+            row.setdefault("event_id", str(uuid.uuid4()))
+            lines.append(json.dumps(row, default=str))
+        data = ("\n".join(lines) + "\n").encode("utf-8")
+        with self._file_lock():
+            with open(self.path, "ab") as f:
+                f.write(data)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+
+    # ---------------- Spool file ----------------
+    @contextmanager
+    def _file_lock(self):
+        """Excludes other threads of this process and, through flock, every other process using the spool."""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            if self._lock_file is None:
+                os.makedirs(os.path.dirname(self.lock_path) or ".", exist_ok=True)
+                self._lock_file = open(self.lock_path, "a")
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _flusher(self):
+        """Yields True in the one process that may flush right now, False in the others."""
+        if fcntl is None:
+            yield True
+            return
+        os.makedirs(os.path.dirname(self.flush_lock_path) or ".", exist_ok=True)
+        with open(self.flush_lock_path, "a") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read_offset(self) -> int:
+        try:
+            with open(self.offset_path, "r") as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _write_offset(self, offset: int):
+        tmp = self.offset_path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(str(offset))
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp, self.offset_path)
+
+    def _recover(self):
+        # drop a half-written last line left by a crash mid-append, so it cannot swallow the next row
+        with self._file_lock():
+            try:
+                with open(self.path, "rb+") as f:
+                    data = f.read()
+                    if data and not data.endswith(b"\n"):
+                        f.truncate(data.rfind(b"\n") + 1)
+            except FileNotFoundError:
+                pass
+
+    def _read_batch(self) -> Tuple[int, int, List[Dict[str, Any]]]:
+        with self._file_lock():
+            offset = end = self._read_offset()
+            rows = []
+            try:
+                with open(self.path, "rb") as f:
+                    f.seek(offset)
+                    for line in f:
+                        if not line.endswith(b"\n"):
+                            break
+                        end += len(line)
+                        try:
+                            rows.append(json.loads(line))
+                        except ValueError:
+                            continue
+                        if len(rows) >= self.batch_size:
+                            break
+            except FileNotFoundError:
+                pass
+            return offset, end, rows
+
+    def _commit(self, end: int):
+        with self._file_lock():
+            try:
+                size = os.path.getsize(self.path)
+            except FileNotFoundError:
+                size = 0
+            if end >= size:
+                # everything is in the database: start the spool over instead of letting it grow
+                open(self.path, "wb").close()
+                self._write_offset(0)
+            else:
+                self._write_offset(end)
+
+    def _dead_letter(self, row: Dict[str, Any], error: Exception):
+        line = json.dumps({"row": row, "error": str(error)}, default=str) + "\n"
+        with self._lock:
+            with open(self.dead_path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+        self.dead += 1
+
+    def pending_bytes(self) -> int:
+        with self._file_lock():
+            try:
+                return max(0, os.path.getsize(self.path) - self._read_offset())
+            except FileNotFoundError:
+                return 0
+
+    # ---------------- Background flush ----------------
+    async def flush_once(self, client) -> int:
+        with self._flusher() as mine:
+            if not mine:
+                return 0  # another worker process is flushing
+            return await self._flush_batch(client)
+
+    async def _flush_batch(self, client) -> int:
+        offset, end, rows = self._read_batch()
+        if end == offset:
+            return 0
+        if rows:
+            try:
+                await self._insert(client, rows)
+            except Exception as e:
+                if not rejected(e):
+                    raise
+                print(f"[attendance] batch of {len(rows)} rejected ({e}), retrying row by row")
+                for row in rows:
+                    try:
+                        await self._insert(client, row)
+                    except Exception as row_error:
+                        if not rejected(row_error):
+                            raise
+                        print(f"[attendance] row moved to {self.dead_path}: {row_error}")
+                        self._dead_letter(row, row_error)
+        self._commit(end)
+        self.flushed += len(rows)
+        return len(rows)
+
+    @staticmethod
+    async def _insert(client, rows):
+        await client.table("attendance_logs").upsert(rows, on_conflict="event_id", ignore_duplicates=True).execute()
+
+    async def flush_all(self, client):
+        while await self.flush_once(client) >= self.batch_size:
+            pass
+
+    async def _run(self):
+        while True:
+            try:
+                await self.flush_all(self._client)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                print(f"[attendance] flush failed, will retry: {e}")
+            await asyncio.sleep(self.flush_seconds)
+
+    def start(self, client):
+        """Replays whatever an earlier process left in the spool, then keeps flushing every flush_seconds."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._recover()
+        self._client = client
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush_all(self._client)
+        except Exception as e:
+            print(f"[attendance] final flush failed, rows stay in {self.path}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending_bytes": self.pending_bytes(),
+            "flushed": self.flushed,
+            "failures": self.failures,
+            "dead_lettered": self.dead,
+            "last_error": self.last_error,
+        }
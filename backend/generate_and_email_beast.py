@@ -1,13 +1,20 @@
 import os
-import re
-import csv
-import smtplib
-import qrcode
+import json
+import time
+import queue
+import argparse
+import itertools
+import threading
 from dotenv import load_dotenv
 from email.message import EmailMessage
 from fpdf import FPDF
 from pathlib import Path
 from io import BytesIO
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from services.smtp_pool import SMTPPool
+from services.qr_service import qr_png_bytes
+from services.roster_reader import RosterReader, chunked
 
 # ✅ Try to import Supabase
 try:
@@ -30,6 +37,7 @@ SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
 SMTP_USER = os.getenv("EMAIL_USER")
 SMTP_PASS = os.getenv("EMAIL_PASS")
 SENDER_NAME = os.getenv("SENDER_NAME", "Hackathon Team")
+mailer = SMTPPool(SMTP_SERVER, SMTP_PORT, SMTP_USER, SMTP_PASS)
 
 EVENT_NAME = os.getenv("EVENT_NAME", "Hackathon Event")
 EVENT_DATE = os.getenv("EVENT_DATE", "TBD")
@@ -40,6 +48,17 @@ TICKETS_DIR.mkdir(exist_ok=True)
 
 PARTICIPANTS_FILE = Path("../data/participants.txt")
 
+# ✅ Mailing pipeline defaults (overridable on the command line)
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", os.cpu_count() or 2))
+SMTP_WORKERS = int(os.getenv("SMTP_WORKERS", 4))
+SEND_RATE = float(os.getenv("SEND_RATE", 5))  # messages per second across all SMTP workers, 0 = unlimited
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", 50))
+JOURNAL_FILE = TICKETS_DIR / "mail_journal.jsonl"
+
+# ✅ Bulk import sizes
+IMPORT_PAGE_SIZE = int(os.getenv("IMPORT_PAGE_SIZE", 1000))
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", 500))
+
 # ✅ Define A6 size (mm) for PDF ticket
 A6_SIZE_MM = (105, 148)  # width x height in mm
 
@@ -56,16 +75,9 @@ else:
 # Helpers
 # =========================
 
-def normalize_student_number(raw: str) -> str:
-    digits = re.sub(r"\D", "", str(raw or ""))
-    return digits[:8] if len(digits) >= 8 else digits
-
 def generate_qr(participant_id: str) -> bytes:
     qr_data = f"{BASE_URL}/checkin/{participant_id}"
-    img = qrcode.make(qr_data)
-    buf = BytesIO()
-    img.save(buf, format="PNG")
-    return buf.getvalue()
+    return qr_png_bytes(qr_data)
 
 def _pdf_to_bytes(pdf: FPDF) -> bytes:
     try:
@@ -118,7 +130,7 @@ def build_pdf_ticket(full_name: str, email: str, participant_id: str, role: str,
 
     return _pdf_to_bytes(pdf)
 
-def build_email(full_name: str, recipient_email: str, participant_id: str, qr_bytes: bytes, role: str) -> EmailMessage:
+def build_message(full_name: str, recipient_email: str, participant_id: str, pdf_bytes: bytes) -> EmailMessage:
     msg = EmailMessage()
     msg["Subject"] = f"{EVENT_NAME} Ticket"
     msg["From"] = f"{SENDER_NAME} <{SMTP_USER}>"
@@ -129,135 +141,323 @@ def build_email(full_name: str, recipient_email: str, participant_id: str, qr_by
         f"See you there!"
     )
 
-    # ✅ Correct order
-    pdf_bytes = build_pdf_ticket(full_name, recipient_email, participant_id, role, qr_bytes)
-
     filename = f"{participant_id}_{full_name}.pdf"
     msg.add_attachment(pdf_bytes, maintype="application", subtype="pdf", filename=filename)
     return msg
 
-def send_email(msg: EmailMessage):
+def build_email(full_name: str, recipient_email: str, participant_id: str, qr_bytes: bytes, role: str) -> EmailMessage:
+    # ✅ Correct order
+    pdf_bytes = build_pdf_ticket(full_name, recipient_email, participant_id, role, qr_bytes)
+    return build_message(full_name, recipient_email, participant_id, pdf_bytes)
+
+def send_email(msg: EmailMessage, pool: SMTPPool = None) -> bool:
     try:
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(SMTP_USER, SMTP_PASS)
-            server.send_message(msg)
+        (pool or mailer).send(msg)
         print(f"✅ Email sent to {msg['To']}")
+        return True
     except Exception as e:
         print(f"❌ Failed to send email to {msg['To']}: {e}")
+        return False
 
 # =========================
 # File Loading
 # =========================
 
-def parse_row(parts):
-    # Expected: email, studentNumber, fullName, role
-    if len(parts) < 4:
-        return None
+def iter_participants_from_file():
+    """Streams validated records straight from the roster file; bad lines are reported and skipped."""
+    if not PARTICIPANTS_FILE.exists():
+        print(f"⚠️ Participants file not found: {PARTICIPANTS_FILE}")
+        return
+    for rec in RosterReader(PARTICIPANTS_FILE):
+        rec["participant_id"] = rec["student_number"]
+        yield rec
 
-    student_number = normalize_student_number(parts[1])
-    full_name = parts[2].strip()
-    role = parts[3].strip().lower()
+def load_participants_from_file():
+    return list(iter_participants_from_file())
+
+def fetch_existing_participant_ids(page_size: int = IMPORT_PAGE_SIZE) -> set:
+    ids, start = set(), 0
+    while True:
+        # ordered, so offset pages neither skip nor repeat ids while other writers touch the table
+        res = (supabase_client.table("participants").select("participant_id").order("participant_id")
+               .range(start, start + page_size - 1).execute())
+        rows = res.data or []
+        ids.update(r["participant_id"] for r in rows if r.get("participant_id"))
+        if len(rows) < page_size:
+            return ids
+        start += page_size
+
+def insert_new_participants(participants, chunk_size: int = IMPORT_CHUNK_SIZE) -> dict:
+    """
+    One paged read of the existing IDs, a set difference, then chunked upserts: about N/chunk_size
+    round trips instead of two per participant. participants can be any iterable (e.g. a streamed
+    roster file); it is consumed chunk by chunk. A chunk that fails is retried row by row so one bad
+    record only fails itself.
+    """
+    counts = {"inserted": 0, "skipped": 0, "failed": 0}
+    if not SUPABASE_ENABLED:
+        return counts
 
-    # ✅ Always generate email from student number
-    email = f"{student_number}@mynwu.ac.za"
+    try:
+        existing = fetch_existing_participant_ids()
+    except Exception as e:
+        print(f"❌ Could not read existing participants: {e}")
+        counts["failed"] = sum(1 for _ in participants)  # may be a generator: count by consuming it
+        return counts
+
+    seen = set()
+    for batch in chunked(participants, chunk_size):
+        chunk = []
+        for p in batch:
+            pid = p.get("participant_id")
+            if not pid or pid in existing or pid in seen:
+                counts["skipped"] += 1
+                continue
+            seen.add(pid)
+            chunk.append(p)
+        if not chunk:
+            continue
+        try:
+            supabase_client.table("participants").upsert(chunk, on_conflict="participant_id", ignore_duplicates=True).execute()
+            counts["inserted"] += len(chunk)
+        except Exception as e:
+            print(f"⚠️ Chunk of {len(chunk)} failed ({e}), retrying row by row")
+            for p in chunk:
+                try:
+                    supabase_client.table("participants").upsert(p, on_conflict="participant_id", ignore_duplicates=True).execute()
+                    counts["inserted"] += 1
+                except Exception as row_error:
+                    counts["failed"] += 1
+                    print(f"❌ Failed to insert {p}: {row_error}")
+
+    print(f"🆕 Participants import: {counts['inserted']} inserted, {counts['skipped']} skipped, {counts['failed']} failed")
+    return counts
+def iter_participants_from_db(page_size: int = IMPORT_PAGE_SIZE):
+    """Every participant row, one page at a time; a single select would stop at the server's row limit."""
+    start = 0
+    while True:
+        res = (supabase_client.table("participants").select("*").order("participant_id")
+               .range(start, start + page_size - 1).execute())
+        rows = res.data or []
+        yield from rows
+        if len(rows) < page_size:
+            return
+        start += page_size
 
-    return {
-        "email": email,
-        "student_number": student_number,
-        "participant_id": student_number,
-        "full_name": full_name,
-        "role": role
-    }
 
-def load_participants_from_file():
-    participants = []
-    if not PARTICIPANTS_FILE.exists():
-        print(f"⚠️ Participants file not found: {PARTICIPANTS_FILE}")
-        return participants
+# =========================
+# Main
+# =========================
 
-    with open(PARTICIPANTS_FILE, "r", encoding="utf-8-sig", newline="") as f:
-        reader = csv.reader(f)
-        for raw in reader:
-            if not raw or (len(raw) == 1 and raw[0].startswith("#")):
-                continue
-            parsed = parse_row(raw)
-            if parsed:
-                participants.append(parsed)
-    return participants
+def render_ticket_job(rec: dict) -> bytes:
+    # runs in a render worker process
+    pid = rec["participant_id"]
+    return build_pdf_ticket(rec.get("full_name", "Unknown"), rec["email"], pid, rec.get("role", "participant"), generate_qr(pid))
 
-def insert_new_participants(participants):
-    if not SUPABASE_ENABLED:
-        return 0
+def ticket_file(rec: dict) -> Path:
+    return TICKETS_DIR / f"{rec['participant_id']}_{rec.get('full_name', 'Unknown')}.pdf"
 
-    inserted = 0
-    for p in participants:
-        try:
-            existing = supabase_client.table("participants").select("participant_id").eq("participant_id", p["participant_id"]).execute()
-            if existing.data:
-                continue
+# =========================
+# Mailing Pipeline
+# =========================
 
-            supabase_client.table("participants").insert(p).execute()
-            inserted += 1
-            print(f"🆕 Inserted participant {p['participant_id']} ({p['full_name']})")
-        except Exception as e:
-            print(f"❌ Failed to insert {p}: {e}")
-    return inserted
+class RateLimiter:
+    """Token bucket shared by the SMTP workers: at most `rate` sends per second, bursts of up to `rate`."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = max(rate, 1)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(max(self.rate, 1), self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class Journal:
+    """Append-only record of every send attempt; participants journaled as sent are skipped on the next run."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def sent_ids(self) -> set:
+        sent = set()
+        if not self.path.exists():
+            return sent
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # torn last line from an interrupted run
+                if entry.get("status") == "sent":
+                    sent.add(entry.get("participant_id"))
+        return sent
+
+    def record(self, participant_id: str, email: str, status: str, error: str = None):
+        entry = {"participant_id": participant_id, "email": email, "status": status, "at": datetime.utcnow().isoformat()}
+        if error:
+            entry["error"] = error
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+_DONE = object()
+
+def run_pipeline(records, render_workers: int = RENDER_WORKERS, smtp_workers: int = SMTP_WORKERS,
+                 send_rate: float = SEND_RATE, queue_size: int = PIPELINE_QUEUE_SIZE, journal: Journal = None) -> dict:
+    """
+    Render workers (processes) build ticket PDFs and feed a bounded queue; smtp_workers threads drain it
+    through one SMTP pool, sharing a send-rate limit. Every outcome is written to the journal.
+    """
+    journal = journal or Journal(JOURNAL_FILE)
+    pool = SMTPPool(SMTP_SERVER, SMTP_PORT, SMTP_USER, SMTP_PASS, size=smtp_workers)
+    limiter = RateLimiter(send_rate)
+    ready = queue.Queue(maxsize=queue_size)
+    counts = {"sent": 0, "failed": 0, "render_failed": 0}
+    counts_lock = threading.Lock()
+
+    def bump(key):
+        with counts_lock:
+            counts[key] += 1
+
+    def smtp_worker():
+        while True:
+            item = ready.get()
+            if item is _DONE:
+                return
+            rec, pdf_bytes = item
+            pid, email, full_name = rec.get("participant_id"), rec.get("email"), rec.get("full_name", "Unknown")
+            # one bad record must not kill the worker: with every worker gone the producer blocks on ready.put
+            try:
+                limiter.acquire()
+                if send_email(build_message(full_name, email, pid, pdf_bytes), pool):
+                    journal.record(pid, email, "sent")
+                    bump("sent")
+                    with open(ticket_file(rec), "wb") as f:
+                        f.write(pdf_bytes)
+                else:
+                    journal.record(pid, email, "failed")
+                    bump("failed")
+            except Exception as e:
+                print(f"❌ Error sending ticket to {email}: {e}")
+                bump("failed")
+                try:
+                    journal.record(pid, email, "failed", str(e))
+                except Exception as journal_error:
+                    print(f"❌ Could not journal {pid}: {journal_error}")
+
+    senders = [threading.Thread(target=smtp_worker, name=f"smtp-{i}", daemon=True) for i in range(smtp_workers)]
+    for t in senders:
+        t.start()
+
+    try:
+        with ProcessPoolExecutor(max_workers=render_workers) as renderers:
+            # keep at most queue_size renders in flight so memory stays bounded however long the roster is
+            pending = {}
+            records = iter(records)
+            exhausted = False
+            while pending or not exhausted:
+                while not exhausted and len(pending) < queue_size:
+                    rec = next(records, None)
+                    if rec is None:
+                        exhausted = True
+                        break
+                    print(f"📝 Generating ticket for {rec.get('full_name', 'Unknown')} ({rec['email']})")
+                    pending[renderers.submit(render_ticket_job, rec)] = rec
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    rec = pending.pop(future)
+                    try:
+                        ready.put((rec, future.result()))
+                    except Exception as e:
+                        print(f"❌ Error rendering ticket for {rec['email']}: {e}")
+                        journal.record(rec["participant_id"], rec["email"], "render_failed", str(e))
+                        bump("render_failed")
+    finally:
+        for _ in senders:
+            ready.put(_DONE)
+        for t in senders:
+            t.join()
+        pool.close()
+    return counts
 
 # =========================
 # Main
 # =========================
 
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate PDF tickets and email them to every participant")
+    parser.add_argument("--render-workers", type=int, default=RENDER_WORKERS)
+    parser.add_argument("--smtp-workers", type=int, default=SMTP_WORKERS)
+    parser.add_argument("--rate", type=float, default=SEND_RATE, help="max emails per second (0 = unlimited)")
+    parser.add_argument("--queue-size", type=int, default=PIPELINE_QUEUE_SIZE)
+    parser.add_argument("--journal", type=Path, default=JOURNAL_FILE)
+    args = parser.parse_args(argv)
+
     print("🚀 Starting ticket generation and email process...")
 
-    participants_from_file = load_participants_from_file()
-    if participants_from_file:
-        insert_new_participants(participants_from_file)
+    if SUPABASE_ENABLED:
+        insert_new_participants(iter_participants_from_file())
 
-    participants = []
+    participants, first = iter(()), None
     if SUPABASE_ENABLED:
+        participants = iter_participants_from_db()
         try:
-            res = supabase_client.table("participants").select("*").execute()
-            participants = res.data or []
+            first = next(participants, None)
         except Exception as e:
             print(f"❌ Error fetching participants: {e}")
 
-    if not participants and participants_from_file:
-        participants = participants_from_file
+    if first is not None:
+        print(f"✅ Streaming participants from the database, {IMPORT_PAGE_SIZE} per page.\n")
+        participants = itertools.chain([first], participants)
+    else:
+        print("ℹ️ No participants in the database, streaming them from the roster file.\n")
+        participants = iter_participants_from_file()
+
+    journal = Journal(args.journal)
+    already_sent = journal.sent_ids()
+    skipped = [0]
+
+    def pending():
+        for rec in participants:
+            pid = rec.get("participant_id")
+            email = rec.get("email")
+
+            if not pid or not email:
+                print(f"❌ Skipping record with missing ID/email: {rec}")
+                skipped[0] += 1
+                continue
+
+            if pid in already_sent or ticket_file(rec).exists():
+                print(f"⏩ Ticket already sent to {email} ({pid}), skipping.")
+                skipped[0] += 1
+                continue
+            yield rec
 
-    if not participants:
+    counts = run_pipeline(pending(), args.render_workers, args.smtp_workers, args.rate, args.queue_size, journal)
+    if not (counts["sent"] or counts["failed"] or counts["render_failed"] or skipped[0]):
         print("⚠️ No participants found.")
         return
+    print(f"🎉 Done: {counts['sent']} sent, {counts['failed']} failed, {counts['render_failed']} failed to render, "
+          f"{skipped[0]} skipped.")
 
-    print(f"✅ Found {len(participants)} participants to process.\n")
-
-    for rec in participants:
-        pid = rec.get("participant_id")
-        email = rec.get("email")
-        full_name = rec.get("full_name", "Unknown")
-        role = rec.get("role", "participant")
-
-        if not pid or not email:
-            print(f"❌ Skipping record with missing ID/email: {rec}")
-            continue
-
-        ticket_path = TICKETS_DIR / f"{pid}_{full_name}.pdf"
-        if ticket_path.exists():
-            print(f"⏩ Ticket already exists for {email} ({pid}), skipping.")
-            continue
-
-        print(f"📝 Generating ticket for {full_name} ({email})")
-        try:
-            qr_bytes = generate_qr(pid)
-            msg = build_email(full_name, email, pid, qr_bytes, role)
-            send_email(msg)
-
-            with open(ticket_path, "wb") as f:
-                f.write(msg.get_payload()[-1].get_payload(decode=True))
-            print(f"💾 Ticket saved: {ticket_path}\n")
-        except Exception as e:
-            print(f"❌ Error processing {email}: {e}")
+    mailer.close()
 
 if __name__ == "__main__":
     main()
@@ -1,67 +1,97 @@
-import os, csv
+import os, csv, argparse
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 from supabase import create_client
 from utils import (
-    supabase_client, parse_participants_line, generate_participant_id,
-    make_qr_png_bytes, upload_qr_to_storage
+    supabase_client, generate_participant_id,
+    make_qr_png_bytes, upload_qr_with_retry
 )
+from services.roster_reader import RosterReader, chunked
 
 load_dotenv()
 DATA_FILE = os.path.join("data", "participants.txt")
 OUT_DIR = os.path.join("data", "qrcodes")
+CHUNK_SIZE = int(os.getenv("QR_CHUNK_SIZE", "200"))
+RENDER_WORKERS = int(os.getenv("QR_RENDER_WORKERS", os.cpu_count() or 2))
+UPLOAD_WORKERS = int(os.getenv("QR_UPLOAD_WORKERS", "8"))
+UPLOAD_ATTEMPTS = int(os.getenv("QR_UPLOAD_ATTEMPTS", "4"))
 os.makedirs(OUT_DIR, exist_ok=True)
 
-def main():
-    sb = supabase_client()
-    to_insert = []
+def store_qr(sb, participant_id: str, qr_png: bytes, attempts: int) -> str:
+    # local copy (optional)
+    local_path = os.path.join(OUT_DIR, f"{participant_id}.png")
+    with open(local_path, "wb") as imgf:
+        imgf.write(qr_png)
+
+    # upload to Storage
+    return upload_qr_with_retry(sb, f"{participant_id}.png", qr_png, attempts=attempts)
 
-    with open(DATA_FILE, "r", encoding="utf-8") as f:
-        for raw in f:
-            raw = raw.strip()
-            if not raw or raw.startswith("#"):
-                continue
-            p = parse_participants_line(raw)
-            if not p:
-                print(f"Skipped invalid line: {raw}")
-                continue
+def build_record(p: dict, participant_id: str, qr_url: str) -> dict:
+    # “Granted” only if they made your final list file:
+    admission_status = "Granted"
 
-            # create participant_id + QR
-            participant_id = generate_participant_id()
-            qr_png = make_qr_png_bytes(participant_id)
+    return {
+        "participant_id": participant_id,
+        "role": p["role"],
+        "full_name": p["full_name"],
+        "email": p["email"],
+        "student_number": p["student_number"],
+        "year_of_study": None,
+        "registration_status": "Registered",
+        "confirmation_status": "Confirmed",
+        "admission_status": admission_status,
+        "qr_code_url": qr_url
+    }
 
-            # local copy (optional)
-            local_path = os.path.join(OUT_DIR, f"{participant_id}.png")
-            with open(local_path, "wb") as imgf:
-                imgf.write(qr_png)
+def process_chunk(sb, chunk, renderers, uploaders, attempts: int):
+    """QRs are encoded on the render processes, uploaded concurrently; returns (records to insert, failures)."""
+    ids = [generate_participant_id() for _ in chunk]
+    pngs = renderers.map(make_qr_png_bytes, ids, chunksize=16)
+    futures = {
+        uploaders.submit(store_qr, sb, participant_id, png, attempts): (p, participant_id)
+        for p, participant_id, png in zip(chunk, ids, pngs)
+    }
+    records, failed = [], []
+    for future in as_completed(futures):
+        p, participant_id = futures[future]
+        try:
+            records.append(build_record(p, participant_id, future.result()))
+        except Exception as e:
+            print(f"[ERROR] Upload of {participant_id} ({p['email']}) failed after {attempts} attempts: {e}")
+            failed.append(p)
+    return records, failed
 
-            # upload to Storage
-            qr_url = upload_qr_to_storage(sb, f"{participant_id}.png", qr_png)
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate participant QR codes, upload them and insert participants")
+    parser.add_argument("--workers", type=int, default=RENDER_WORKERS, help="QR render processes")
+    parser.add_argument("--upload-workers", type=int, default=UPLOAD_WORKERS, help="concurrent Storage uploads")
+    parser.add_argument("--attempts", type=int, default=UPLOAD_ATTEMPTS, help="upload attempts per QR")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
 
-            # “Granted” only if they made your final list file:
-            admission_status = "Granted"
+    # one client for every upload thread: its HTTP connection pool is shared
+    sb = supabase_client()
+    roster = RosterReader(DATA_FILE)
+    inserted, failed = 0, 0
 
-            rec = {
-                "participant_id": participant_id,
-                "role": p["role"],
-                "full_name": p["full_name"],
-                "email": p["email"],
-                "student_number": p["student_number"],
-                "year_of_study": None,
-                "registration_status": "Registered",
-                "confirmation_status": "Confirmed",
-                "admission_status": admission_status,
-                "qr_code_url": qr_url
-            }
-            to_insert.append(rec)
+    # the file is streamed: each chunk is rendered, uploaded and inserted before the next is read
+    with ProcessPoolExecutor(max_workers=args.workers) as renderers, \
+            ThreadPoolExecutor(max_workers=args.upload_workers) as uploaders:
+        for chunk in chunked(roster, args.chunk_size):
+            to_insert, chunk_failed = process_chunk(sb, chunk, renderers, uploaders, args.attempts)
+            failed += len(chunk_failed)
+            if to_insert:
+                # only rows whose QR made it to Storage; Insert via SERVICE ROLE (bypasses client insert policy)
+                sb.table("participants").insert(to_insert).execute()
+                inserted += len(to_insert)
+                print(f"Inserted {inserted} participants so far.")
 
-    if not to_insert:
+    if not inserted and not failed:
         print("No participants to insert.")
         return
-
-    # Insert via SERVICE ROLE (bypasses client insert policy)
-    res = sb.table("participants").insert(to_insert).execute()
-    print(f"Inserted {len(to_insert)} participants.")
+    print(f"Inserted {inserted} participants; {failed} left out because their QR upload failed; "
+          f"{roster.bad} invalid lines skipped.")
 
 if __name__ == "__main__":
     main()
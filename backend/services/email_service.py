@@ -1,6 +1,7 @@
-import os, ssl, smtplib
+import os
 from email.message import EmailMessage
 from dotenv import load_dotenv
+from .smtp_pool import SMTPPool
 
 
 load_dotenv()
@@ -10,6 +11,7 @@ SMTP_EMAIL = os.getenv("SMTP_EMAIL")
 SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
 SENDER_NAME = os.getenv("SENDER_NAME", "Hackathon Team")
 EVENT_NAME = os.getenv("EVENT_NAME", "Internal Hackathon")
+mailer = SMTPPool(SMTP_SERVER, SMTP_PORT, SMTP_EMAIL, SMTP_PASSWORD)
 
 
 
@@ -35,8 +37,4 @@ def send_download_link(to_email: str, full_name: str, url: str):
     msg.set_content(body)
 
 
-    ctx = ssl.create_default_context()
-    with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-        server.starttls(context=ctx)
-        server.login(SMTP_EMAIL, SMTP_PASSWORD)
-        server.send_message(msg)
\ No newline at end of file
+    mailer.send(msg)
\ No newline at end of file
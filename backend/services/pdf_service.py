@@ -1,4 +1,6 @@
-import os
+import io, os, time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, List, Tuple
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import mm
@@ -9,13 +11,16 @@ from .qr_service import qr_png_bytes
 
 
 PAGE_W, PAGE_H = A4
+TICKET_TITLE = "NWU Internal Hackathon – Ticket"
 
 
 # Creates a clean ticket PDF: Name Surname, Student Number, QR code
 
 
-def make_ticket_pdf(full_name: str, student_number: str, code_value: str, out_path: str):
-    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+def make_ticket_pdf(full_name: str, student_number: str, code_value: str, out_path):
+    # out_path may also be a binary file object (see ticket_pdf_bytes)
+    if isinstance(out_path, str):
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
 
 
     # Generate QR PNG in-memory
@@ -28,7 +33,7 @@ def make_ticket_pdf(full_name: str, student_number: str, code_value: str, out_pa
 
     # Title
     c.setFont("Helvetica-Bold", 18)
-    c.drawString(25*mm, (PAGE_H-30*mm), "NWU Internal Hackathon – Ticket")
+    c.drawString(25*mm, (PAGE_H-30*mm), TICKET_TITLE)
 
 
     # Body text
@@ -48,4 +53,125 @@ def make_ticket_pdf(full_name: str, student_number: str, code_value: str, out_pa
 
 
     c.showPage()
-    c.save()
\ No newline at end of file
+    c.save()
+
+
+
+def ticket_pdf_bytes(full_name: str, student_number: str, code_value: str) -> bytes:
+    buf = io.BytesIO()
+    make_ticket_pdf(full_name, student_number, code_value, buf)
+    return buf.getvalue()
+
+
+
+# ---------------- Batch print runs ----------------
+# (full_name, student_number, code_value) per ticket; cols x rows tickets per A4 sheet
+SHEET_COLS = int(os.getenv("PRINT_SHEET_COLS", "2"))
+SHEET_ROWS = int(os.getenv("PRINT_SHEET_ROWS", "4"))
+PRINT_CHUNK_PAGES = int(os.getenv("PRINT_CHUNK_PAGES", "50"))
+
+
+def _draw_qr(c, code_value: str, x: float, y: float, size: float):
+    # one pixel per module, scaled up by the PDF itself (images are not interpolated unless asked):
+    # a few hundred bytes per code, and far cheaper for reportlab than drawing the modules as vectors
+    c.drawImage(ImageReader(io.BytesIO(qr_png_bytes(code_value, box_size=1))), x, y, width=size, height=size)
+
+
+def _fit_string(c, text: str, font: str, size: float, width: float) -> float:
+    while size > 6 and c.stringWidth(text, font, size) > width:
+        size -= 0.5
+    return size
+
+
+def make_ticket_sheets(tickets: Iterable[Tuple[str, str, str]], out_path, cols: int = SHEET_COLS, rows: int = SHEET_ROWS) -> int:
+    """Lays tickets out cols x rows per A4 sheet in one PDF; returns the number of pages."""
+    if isinstance(out_path, str):
+        os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    c = canvas.Canvas(out_path, pagesize=A4)
+    cell_w, cell_h = PAGE_W / cols, PAGE_H / rows
+    qr_size = min(cell_h - 14*mm, cell_w * 0.45)
+    text_w = cell_w - qr_size - 14*mm
+
+    # everything that is the same on every ticket is stored once in the document and placed by reference
+    c.beginForm("ticket_cell")
+    c.setLineWidth(0.3)
+    c.setDash(2, 2)
+    c.rect(0, 0, cell_w, cell_h)
+    c.setDash()
+    c.setFont("Helvetica-Bold", 10)
+    c.drawString(6*mm, cell_h - 9*mm, TICKET_TITLE)
+    c.setFont("Helvetica-Oblique", 6)
+    c.drawString(6*mm, 4*mm, "Present this ticket at bus boarding, registration, and meal collection.")
+    c.endForm()
+
+    per_page = cols * rows
+    pages = 0
+    for i, (full_name, student_number, code_value) in enumerate(tickets):
+        slot = i % per_page
+        if slot == 0:
+            if i:
+                c.showPage()
+            pages += 1
+        x, y = (slot % cols) * cell_w, PAGE_H - (slot // cols + 1) * cell_h
+        c.saveState()
+        c.translate(x, y)
+        c.doForm("ticket_cell")
+        size = _fit_string(c, full_name, "Helvetica-Bold", 11, text_w)
+        c.setFont("Helvetica-Bold", size)
+        c.drawString(6*mm, cell_h - 20*mm, full_name)
+        c.setFont("Helvetica", 9)
+        c.drawString(6*mm, cell_h - 27*mm, f"Student Number: {student_number}")
+        _draw_qr(c, code_value, cell_w - qr_size - 6*mm, 8*mm, qr_size)
+        c.restoreState()
+    c.showPage()
+    c.save()
+    return pages
+
+
+def _render_part(job: Tuple[List[Tuple[str, str, str]], str, int, int]) -> int:
+    tickets, path, cols, rows = job
+    return make_ticket_sheets(tickets, path, cols, rows)
+
+
+def render_print_run(tickets: Iterable[Tuple[str, str, str]], out_path: str, workers: int = None,
+                     chunk_pages: int = PRINT_CHUNK_PAGES, cols: int = SHEET_COLS, rows: int = SHEET_ROWS) -> dict:
+    """
+    Renders a whole roster as multi-up sheets: chunk_pages pages per part, parts rendered in parallel processes
+    and then joined into out_path with pypdf. Raises RuntimeError before rendering anything when the run needs
+    more than one part and pypdf is not installed.
+    """
+    tickets = list(tickets)
+    chunk = chunk_pages * cols * rows
+    base = out_path[:-4] if out_path.endswith(".pdf") else out_path
+    jobs = [(tickets[i:i + chunk], f"{base}.part{n:03d}.pdf", cols, rows)
+            for n, i in enumerate(range(0, len(tickets), chunk))]
+    if len(jobs) > 1:
+        try:
+            from pypdf import PdfWriter
+        except ImportError:
+            raise RuntimeError(f"pypdf is required to join {len(jobs)} print-run parts (pip install -r requirements.txt), "
+                               f"or raise chunk_pages to {-(-len(tickets) // (cols * rows))} to render one part")
+
+    start = time.perf_counter()
+    if len(jobs) <= 1:
+        pages = make_ticket_sheets(tickets, out_path, cols, rows)
+        files = [out_path]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pages = sum(pool.map(_render_part, jobs))
+        writer = PdfWriter()
+        for _, path, _, _ in jobs:
+            writer.append(path)
+        with open(out_path, "wb") as f:
+            writer.write(f)
+        for _, path, _, _ in jobs:
+            os.remove(path)
+        files = [out_path]
+    elapsed = time.perf_counter() - start
+    return {
+        "tickets": len(tickets),
+        "pages": pages,
+        "files": files,
+        "seconds": round(elapsed, 3),
+        "pages_per_second": round(pages / elapsed, 1) if elapsed else None,
+    }
@@ -0,0 +1,59 @@
+import io, os, zlib, struct
+from functools import lru_cache
+from typing import Tuple
+import qrcode
+from qrcode.constants import ERROR_CORRECT_M
+from PIL import Image
+
+
+# Every QR we print is encoded here. Version and mask are pinned instead of searched for: picking the best
+# of the 8 masks is most of qrcode's CPU time, and a fixed version keeps every code on a ticket the same size.
+# Payloads that do not fit the pinned version still grow to the next one that does.
+QR_VERSION = int(os.getenv("QR_VERSION", "5"))          # 37x37 modules, up to 84 bytes at level M (ticket payloads)
+ID_QR_VERSION = int(os.getenv("ID_QR_VERSION", "2"))    # 25x25 modules, up to 26 bytes (bare participant ids)
+QR_MASK_PATTERN = int(os.getenv("QR_MASK_PATTERN", "2"))
+QR_CACHE_SIZE = int(os.getenv("QR_CACHE_SIZE", "4096"))
+QR_BORDER = 4
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+@lru_cache(maxsize=QR_CACHE_SIZE)
+def qr_matrix(payload: str, version: int = QR_VERSION) -> Tuple[Tuple[bool, ...], ...]:
+    """Module matrix (True = dark), quiet zone included."""
+    qr = qrcode.QRCode(version=version, error_correction=ERROR_CORRECT_M, border=QR_BORDER, mask_pattern=QR_MASK_PATTERN)
+    qr.add_data(payload)
+    qr.make(fit=True)
+    return tuple(tuple(row) for row in qr.get_matrix())
+
+
+def _chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+@lru_cache(maxsize=QR_CACHE_SIZE)
+def qr_png_bytes(payload: str, box_size: int = 10, version: int = QR_VERSION) -> bytes:
+    """1-bit grayscale PNG of the code, box_size pixels per module, written straight from the matrix."""
+    matrix = qr_matrix(payload, version)
+    size = len(matrix) * box_size
+    pad = "0" * (-size % 8)
+    row_bytes = (size + len(pad)) // 8
+    raw = bytearray()
+    for row in matrix:
+        # filter byte 0, then one bit per pixel (0 = black)
+        bits = "".join(("0" if dark else "1") * box_size for dark in row) + pad
+        raw += (b"\x00" + int(bits, 2).to_bytes(row_bytes, "big")) * box_size
+    header = struct.pack(">IIBBBBB", size, size, 1, 0, 0, 0, 0)
+    return _PNG_SIGNATURE + _chunk(b"IHDR", header) + _chunk(b"IDAT", zlib.compress(bytes(raw), 9)) + _chunk(b"IEND", b"")
+
+
+def qr_image(payload: str, size: int, version: int = QR_VERSION) -> Image.Image:
+    """The code as a mode "1" PIL image of size x size pixels, for pasting into a larger image."""
+    box_size = max(1, size // len(qr_matrix(payload, version)))
+    img = Image.open(io.BytesIO(qr_png_bytes(payload, box_size, version)))
+    return img if img.size == (size, size) else img.resize((size, size), Image.NEAREST)
+
+
+def cache_stats() -> dict:
+    matrix, png = qr_matrix.cache_info(), qr_png_bytes.cache_info()
+    return {"matrix_hits": matrix.hits, "matrix_misses": matrix.misses, "png_hits": png.hits, "png_misses": png.misses}
@@ -1,8 +0,0 @@
-import io, qrcode
-
-
-def qr_png_bytes(payload: str) -> bytes:
-    img = qrcode.make(payload)
-    buf = io.BytesIO()
-    img.save(buf, format="PNG")
-    return buf.getvalue()
\ No newline at end of file
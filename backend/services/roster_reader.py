@@ -0,0 +1,95 @@
+import csv, re
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+
+EMAIL_DOMAIN = "mynwu.ac.za"
+ROLES = ("participant", "judge")
+
+
+def normalize_student_number(raw: str) -> str:
+    digits = re.sub(r"\D", "", str(raw or ""))
+    return digits[:8] if len(digits) >= 8 else digits
+
+
+def parse_fields(parts: List[str]) -> Dict[str, str]:
+    """
+    Turns one roster row into a normalized record. Both layouts in use are accepted, with or without a role:
+        email, studentNumber, fullName[, role]      (backend/data/participants.txt)
+        fullName, email, studentNumber[, role]      (data/participants.txt)
+    Columns are recognised by content: the field with an "@" is the email, the all-digit field is the
+    student number, a fourth column is the role (anything but a known role becomes "participant")
+    and the remaining field is the name.
+    The email is always rebuilt from the student number. Raises ValueError with the reason for bad rows.
+    """
+    fields = [p.strip() for p in parts]
+    if len(fields) < 3:
+        raise ValueError("expected at least 3 columns")
+
+    role = fields.pop().lower() if len(fields) >= 4 else ""
+    if role not in ROLES:
+        role = "participant"
+
+    email = next((f for f in fields if "@" in f), "")
+    number = next((f for f in fields if f and f != email and f.isdigit()), "")
+    if not number and email:
+        number = email.split("@", 1)[0]
+    student_number = normalize_student_number(number)
+    if len(student_number) != 8:
+        raise ValueError(f"no 8-digit student number in {fields}")
+
+    full_name = next((f for f in fields if f and f != email and f != number), "") or student_number
+
+    return {
+        "email": f"{student_number}@{EMAIL_DOMAIN}",
+        "student_number": student_number,
+        "full_name": full_name,
+        "role": role,
+    }
+
+
+def _report_bad(line_no: int, raw: List[str], reason: str):
+    print(f"Skipped invalid line {line_no}: {','.join(raw)} ({reason})")
+
+
+class RosterReader:
+    """
+    Streams a roster file one row at a time: nothing is held beyond the current line, so memory stays flat
+    whatever the file size and the first record is available as soon as the first line is read.
+    Blank lines and lines starting with "#" are ignored; bad rows go to on_bad and are counted.
+    """
+
+    def __init__(self, path, on_bad: Optional[Callable[[int, List[str], str], None]] = _report_bad):
+        self.path = path
+        self.on_bad = on_bad
+        self.read = 0
+        self.valid = 0
+        self.bad = 0
+
+    def __iter__(self) -> Iterator[Dict[str, str]]:
+        with open(self.path, "r", encoding="utf-8-sig", newline="") as f:
+            for line_no, raw in enumerate(csv.reader(f), start=1):
+                if not raw or not "".join(raw).strip() or raw[0].lstrip().startswith("#"):
+                    continue
+                self.read += 1
+                try:
+                    record = parse_fields(raw)
+                except ValueError as e:
+                    self.bad += 1
+                    if self.on_bad:
+                        self.on_bad(line_no, raw, str(e))
+                    continue
+                self.valid += 1
+                yield record
+
+    def stats(self) -> Dict[str, int]:
+        return {"read": self.read, "valid": self.valid, "bad": self.bad}
+
+
+def chunked(records: Iterable, size: int) -> Iterator[list]:
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, size))
+        if not chunk:
+            return
+        yield chunk
@@ -0,0 +1,131 @@
+import os, ssl, time, queue, smtplib, threading
+from email.message import EmailMessage
+from typing import Optional
+from dotenv import load_dotenv
+
+
+load_dotenv()
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "2"))
+SMTP_MAX_PER_CONNECTION = int(os.getenv("SMTP_MAX_PER_CONNECTION", "100"))
+SMTP_NOOP_AFTER_SECONDS = float(os.getenv("SMTP_NOOP_AFTER_SECONDS", "30"))
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "30"))
+
+
+def _connection_lost(e: Exception) -> bool:
+    # SMTPException subclasses OSError, so socket errors have to be told apart from SMTP replies
+    if isinstance(e, smtplib.SMTPServerDisconnected):
+        return True
+    return isinstance(e, OSError) and not isinstance(e, smtplib.SMTPException)
+
+
+class _Conn:
+    def __init__(self, server: smtplib.SMTP):
+        self.server = server
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+
+class SMTPPool:
+    """
+    A small pool of logged-in SMTP connections shared by every sender in the process.
+    Connections idle for longer than noop_after seconds get a NOOP before reuse, a dead one is replaced
+    transparently (and the message retried once), and each connection is retired after max_per_connection
+    messages because most providers cap messages per session.
+    """
+
+    def __init__(self, host: str, port: int, username: Optional[str], password: Optional[str],
+                 size: int = SMTP_POOL_SIZE, max_per_connection: int = SMTP_MAX_PER_CONNECTION,
+                 noop_after: float = SMTP_NOOP_AFTER_SECONDS, timeout: float = SMTP_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.max_per_connection = max_per_connection
+        self.noop_after = noop_after
+        self.timeout = timeout
+        self._idle: "queue.LifoQueue[_Conn]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._ssl = ssl.create_default_context()
+        self.connects = 0
+        self.sent = 0
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.host and self.username and self.password)
+
+    def _connect(self) -> _Conn:
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            server.starttls(context=self._ssl)
+            server.login(self.username, self.password)
+        except Exception:
+            self._close(server)
+            raise
+        self.connects += 1
+        return _Conn(server)
+
+    @staticmethod
+    def _close(server: smtplib.SMTP):
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+    def _alive(self, conn: _Conn) -> bool:
+        if time.monotonic() - conn.last_used < self.noop_after:
+            return True
+        try:
+            return conn.server.noop()[0] == 250
+        except Exception:
+            return False
+
+    def _acquire(self) -> _Conn:
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+            if self._alive(conn):
+                return conn
+            self._close(conn.server)
+
+    def _release(self, conn: _Conn):
+        conn.last_used = time.monotonic()
+        if conn.sent >= self.max_per_connection:
+            self._close(conn.server)
+        else:
+            self._idle.put(conn)
+
+    def send(self, msg: EmailMessage):
+        with self._slots:
+            conn = self._acquire()
+            try:
+                conn.server.send_message(msg)
+            except Exception as e:
+                if not _connection_lost(e):
+                    self._release(conn)
+                    raise
+                # the server dropped us between the health check and the send: reconnect and retry once
+                self._close(conn.server)
+                conn = self._connect()
+                try:
+                    conn.server.send_message(msg)
+                except Exception:
+                    self._close(conn.server)
+                    raise
+            conn.sent += 1
+            self.sent += 1
+            self._release(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._close(self._idle.get_nowait().server)
+            except queue.Empty:
+                return
+
+    def stats(self) -> dict:
+        return {"idle": self._idle.qsize(), "connects": self.connects, "sent": self.sent}
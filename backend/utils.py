@@ -1,7 +1,9 @@
-import os, io, re, uuid, qrcode
+import os, re, csv, time, uuid
 from datetime import datetime
 from dotenv import load_dotenv
 from supabase import create_client, Client
+from services.roster_reader import parse_fields
+from services.qr_service import qr_png_bytes, ID_QR_VERSION
 
 load_dotenv()
 
@@ -22,10 +24,7 @@ def generate_participant_id() -> str:
     return f"{EVENT_CODE}-{token}"
 
 def make_qr_png_bytes(payload: str) -> bytes:
-    img = qrcode.make(payload)
-    buf = io.BytesIO()
-    img.save(buf, format="PNG")
-    return buf.getvalue()
+    return qr_png_bytes(payload, version=ID_QR_VERSION)
 
 def upload_qr_to_storage(supabase: Client, filename: str, png_bytes: bytes) -> str:
     """
@@ -46,29 +45,33 @@ def upload_qr_to_storage(supabase: Client, filename: str, png_bytes: bytes) -> s
         print(f"[ERROR] Failed to upload {filename} to storage: {e}")
         return ""
 
+def upload_qr_with_retry(supabase: Client, filename: str, png_bytes: bytes, attempts: int = 4, backoff: float = 0.5) -> str:
+    """
+    Like upload_qr_to_storage, but retries with exponential backoff (backoff, 2*backoff, ...)
+    and raises the last error instead of returning "" once every attempt has failed.
+    """
+    for attempt in range(attempts):
+        try:
+            supabase.storage.from_(QR_BUCKET).upload(
+                path=filename,
+                file=png_bytes,
+                file_options={"content-type": "image/png", "upsert": "true"}
+            )
+            return supabase.storage.from_(QR_BUCKET).get_public_url(filename)
+        except Exception:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(backoff * (2 ** attempt))
+
 
 def parse_participants_line(line: str):
     """
     Accepts:
-    Name,Email
-    Name,Email,StudentNumber
-    Name,Email,StudentNumber,Role
+    Name,Email,StudentNumber[,Role]
+    Email,StudentNumber,Name[,Role]
+    Same rules as services.roster_reader (the streaming reader); returns None for invalid lines.
     """
-    parts = [p.strip() for p in line.split(",")]
-    if len(parts) < 3:  # require student number
+    try:
+        return parse_fields(next(csv.reader([line])))
+    except (ValueError, StopIteration):
         return None
-
-    full_name = parts[2]  # what appears on certificate
-    student_number = parts[1]  # student number
-    role = parts[3].lower() if len(parts) >= 4 and parts[3] else "participant"
-    if role not in ("participant","judge"): role = "participant"
-
-    # Proper NWU email
-    email = f"{student_number}@mynwu.ac.za"
-
-    return {
-        "full_name": full_name,
-        "email": email,
-        "student_number": student_number,
-        "role": role
-    }
@@ -0,0 +1,203 @@
+# bench/fake_postgrest.py
+# In-memory stand-in for the PostgREST endpoints main.py uses (table select/insert/upsert/update/delete and the
+# record_scan / mark_scans procedures), with injectable latency. Started by bench/run_bench.py; can also be run on its own:
+#     python bench/fake_postgrest.py --port 54321 --latency-ms 20
+import json, random, asyncio, argparse
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+RESERVED_PARAMS = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+SCAN_COLUMNS = {
+    "checkin": ("checkin_status", "checkin_timestamp"),
+    "boarding": ("transport_status", "transport_timestamp"),
+    "meal": ("meal_status", "meal_timestamp"),
+}
+
+
+def seed_participants(count: int) -> List[Dict[str, Any]]:
+    return [{
+        "id": i + 1,
+        "participant_id": f"BENCH-{i:06d}",
+        "full_name": f"Bench Participant {i}",
+        "email": f"bench{i}@example.com",
+        "student_number": f"{i:08d}",
+        "role": "participant",
+        "registration_status": "registered",
+        "checkin_status": False, "checkin_timestamp": None,
+        "transport_status": False, "transport_timestamp": None,
+        "meal_status": False, "meal_timestamp": None,
+    } for i in range(count)]
+
+
+def _unquote(value: str) -> str:
+    return value[1:-1] if len(value) > 1 and value[0] == value[-1] == '"' else value
+
+
+def _matches(row: Dict[str, Any], column: str, expr: str) -> bool:
+    op, _, value = expr.partition(".")
+    have = row.get(column)
+    if op == "is":
+        return have is None if value == "null" else str(have).lower() == value
+    if op == "in":
+        return str(have) in {_unquote(v) for v in value.strip("()").split(",")}
+    if have is None:
+        return False
+    have, value = str(have), _unquote(value)
+    return {"eq": have == value, "neq": have != value, "gt": have > value, "gte": have >= value,
+            "lt": have < value, "lte": have <= value}.get(op, False)
+
+
+class FakePostgrest:
+    """Tables are lists of dicts; filters compare values as strings, which is enough for the API's queries."""
+
+    def __init__(self, latency_ms: float = 20, jitter_ms: float = 5, participants: int = 20000,
+                 facilitator_email: str = "bench@example.com", password_hash: Optional[str] = None):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.tables: Dict[str, List[Dict[str, Any]]] = {
+            "participants": seed_participants(participants),
+            "tickets": [],
+            "attendance_logs": [],
+            "profiles": [{"id": 1, "email": facilitator_email, "role": "facilitator", "password_hash": password_hash}],
+        }
+        self._by_pid = {p["participant_id"]: p for p in self.tables["participants"]}
+        self._by_email = {p["email"]: p for p in self.tables["participants"]}
+        self._ids = Counter({name: len(rows) for name, rows in self.tables.items()})
+        self.calls: Counter = Counter()  # "table.operation" -> requests served
+
+    async def delay(self):
+        if self.latency or self.jitter:
+            await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+
+    def _filtered(self, table: str, params) -> List[Dict[str, Any]]:
+        filters = [(k, v) for k, v in params.multi_items() if k not in RESERVED_PARAMS]
+        rows = self.tables.setdefault(table, [])
+        if table == "participants":
+            # point lookups skip the scan, like an index would
+            for column, index in (("participant_id", self._by_pid), ("email", self._by_email)):
+                value = params.get(column, "")
+                if value.startswith("eq."):
+                    row = index.get(_unquote(value[3:]))
+                    rows = [row] if row else []
+                    break
+        return [r for r in rows if all(_matches(r, k, v) for k, v in filters)]
+
+    def _insert(self, table: str, row: Dict[str, Any]) -> Dict[str, Any]:
+        self._ids[table] += 1
+        row = {"id": self._ids[table], **row}
+        self.tables.setdefault(table, []).append(row)
+        if table == "participants":
+            self._by_pid[row.get("participant_id")] = row
+            self._by_email[row.get("email")] = row
+        return row
+
+    # ---------------- Handlers ----------------
+    async def table(self, request: Request) -> Response:
+        table, method = request.path_params["table"], request.method
+        prefer = request.headers.get("prefer", "")
+        await self.delay()
+        if method in ("GET", "HEAD"):
+            self.calls[f"{table}.select"] += 1
+            rows = self._filtered(table, request.query_params)
+            order = request.query_params.get("order")
+            # "a.asc,b.desc": sort by the last key first so earlier keys win
+            for term in reversed(order.split(",") if order else []):
+                column, _, direction = term.partition(".")
+                rows = sorted(rows, key=lambda r: (r.get(column) is None, r.get(column)), reverse=direction.startswith("desc"))
+            offset = int(request.query_params.get("offset", 0))
+            limit = request.query_params.get("limit")
+            rows = rows[offset:offset + int(limit)] if limit else rows[offset:]
+            select = request.query_params.get("select", "*")
+            if select != "*":
+                columns = select.split(",")
+                rows = [{c: r.get(c) for c in columns} for r in rows]
+            return JSONResponse(rows)
+
+        body = json.loads(await request.body() or b"null")
+        if method == "POST":
+            payload = body if isinstance(body, list) else [body]
+            conflict = request.query_params.get("on_conflict")
+            operation = "upsert" if "resolution=" in prefer else "insert"
+            self.calls[f"{table}.{operation}"] += 1
+            out = []
+            existing = {r.get(conflict): r for r in self.tables.get(table, [])} if conflict else {}
+            for row in payload:
+                found = existing.get(row.get(conflict)) if conflict else None
+                if found is not None:
+                    if "resolution=merge-duplicates" in prefer:
+                        found.update(row)
+                        out.append(found)
+                    continue
+                out.append(self._insert(table, row))
+            return JSONResponse(out if "return=representation" in prefer else [], status_code=201)
+        if method == "PATCH":
+            self.calls[f"{table}.update"] += 1
+            rows = self._filtered(table, request.query_params)
+            for row in rows:
+                row.update(body or {})
+            return JSONResponse(rows)
+        if method == "DELETE":
+            self.calls[f"{table}.delete"] += 1
+            rows = self._filtered(table, request.query_params)
+            self.tables[table] = [r for r in self.tables[table] if r not in rows]
+            return JSONResponse(rows)
+        return JSONResponse({"message": f"{method} not supported"}, status_code=405)
+
+    async def rpc(self, request: Request) -> Response:
+        name = request.path_params["name"]
+        self.calls[f"{name}.rpc"] += 1
+        await self.delay()
+        if name not in ("record_scan", "mark_scans"):
+            return JSONResponse({"message": f"function {name} not found", "code": "PGRST202"}, status_code=404)
+        args = await request.json()
+        if args.get("p_event_type") not in SCAN_COLUMNS:
+            return JSONResponse({"message": "unknown event type", "code": "22023"}, status_code=400)
+        status_col, ts_col = SCAN_COLUMNS[args["p_event_type"]]
+        if name == "mark_scans":
+            # timestamps arrive as UTC isoformat strings, so the string max is the latest
+            out = []
+            for scan in args.get("p_scans") or []:
+                row = self._by_pid.get(scan.get("participant_id"))
+                if row is not None:
+                    row[status_col] = True
+                    row[ts_col] = max(filter(None, (row.get(ts_col), scan.get("scanned_at"))))
+                    out.append({"participant_id": row["participant_id"]})
+            return JSONResponse(out)
+        row = self._by_pid.get(args.get("p_participant_id")) if args.get("p_participant_id") else self._by_email.get(args.get("p_email"))
+        if row is None:
+            return JSONResponse([])
+        row[status_col], row[ts_col] = True, args.get("p_scanned_at")
+        self._insert("attendance_logs", {"participant_id": row["participant_id"], "event_type": args["p_event_type"],
+                                         "status": True, "timestamp": args.get("p_scanned_at")})
+        return JSONResponse([{"participant_id": row["participant_id"], "full_name": row["full_name"]}])
+
+    async def stats(self, request: Request) -> Response:
+        return JSONResponse({"calls": dict(self.calls), "rows": {t: len(r) for t, r in self.tables.items()}})
+
+    def app(self) -> Starlette:
+        return Starlette(routes=[
+            Route("/_bench/stats", self.stats),
+            Route("/rest/v1/rpc/{name}", self.rpc, methods=["POST"]),
+            Route("/rest/v1/{table}", self.table, methods=["GET", "HEAD", "POST", "PATCH", "DELETE"]),
+        ])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="In-memory PostgREST stand-in for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=54321)
+    parser.add_argument("--latency-ms", type=float, default=20, help="mean added latency per request")
+    parser.add_argument("--jitter-ms", type=float, default=5, help="standard deviation of the added latency")
+    parser.add_argument("--participants", type=int, default=20000)
+    parser.add_argument("--facilitator-email", default="bench@example.com")
+    parser.add_argument("--password-hash", help="password_hash of the seeded facilitator profile")
+    args = parser.parse_args()
+
+    fake = FakePostgrest(args.latency_ms, args.jitter_ms, args.participants, args.facilitator_email, args.password_hash)
+    uvicorn.run(fake.app(), host=args.host, port=args.port, log_level="warning")
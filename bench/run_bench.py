@@ -0,0 +1,295 @@
+# bench/run_bench.py
+"""
+Load test for the scan API. Starts bench/fake_postgrest.py and main.py (uvicorn) on local ports, drives
+/checkin, /boarding, /meals and /facilitators/login with --concurrency clients for --duration seconds, and
+reports throughput and p50/p95/p99 latency per endpoint. --json writes the report so runs can be compared
+across commits; --compare prints the change against an earlier report.
+
+    python bench/run_bench.py --concurrency 64 --duration 30 --latency-ms 25 --json bench/results/$(git rev-parse --short HEAD).json
+"""
+import os, sys, json, time, random, socket, asyncio, secrets, argparse, tempfile, subprocess
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+
+import httpx
+from jose import jwt
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from qr_token import sign_qr_token  # noqa: E402
+
+ENDPOINTS = {"checkin": "/checkin", "boarding": "/boarding", "meal": "/meals", "login": "/facilitators/login"}
+FACILITATOR_EMAIL = "bench@example.com"
+FACILITATOR_PASSWORD = "bench-password"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in ENDPOINTS:
+            raise SystemExit(f"unknown endpoint in --mix: {name} (choose from {', '.join(ENDPOINTS)})")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+def percentile(sorted_values: List[float], p: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))]
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=30).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def password_hash(rounds: int) -> Optional[str]:
+    # same scheme and cost as the API so login measures real bcrypt work
+    try:
+        from passlib.context import CryptContext
+        return CryptContext(schemes=["bcrypt"], bcrypt__default_rounds=rounds).hash(FACILITATOR_PASSWORD)
+    except Exception as e:
+        print(f"⚠️ cannot hash the bench password ({e}); login is left out of the mix")
+        return None
+
+
+# ---------------- Processes ----------------
+def start_processes(args, hashed: Optional[str], env: Dict[str, str]) -> List[subprocess.Popen]:
+    fake = subprocess.Popen([sys.executable, os.path.join(ROOT, "bench", "fake_postgrest.py"),
+                             "--port", str(args.fake_port), "--latency-ms", str(args.latency_ms),
+                             "--jitter-ms", str(args.jitter_ms), "--participants", str(args.participants),
+                             "--facilitator-email", FACILITATOR_EMAIL]
+                            + (["--password-hash", hashed] if hashed else []), cwd=ROOT)
+    api = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+                            "--port", str(args.api_port), "--workers", str(args.workers), "--log-level", "warning"],
+                           cwd=ROOT, env=env)
+    return [fake, api]
+
+
+async def wait_ready(url: str, timeout: float, processes: List[subprocess.Popen]):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if any(p.poll() is not None for p in processes):
+                raise SystemExit("a bench process exited during startup")
+            try:
+                if (await client.get(url, timeout=2)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise SystemExit(f"{url} not ready after {timeout:g}s")
+
+
+# ---------------- Load ----------------
+class Load:
+    """Weighted endpoint mix. Scans walk a shuffled participant list per event type, so each scan is a first
+    scan until the list runs out; --repeat-ratio sends that share of scans to already scanned tickets instead."""
+
+    def __init__(self, args, codes: List[str], weights: Dict[str, float]):
+        self.args = args
+        self.codes = codes
+        self.names = list(weights)
+        self.weights = list(weights.values())
+        self.queues = {e: deque(random.sample(range(len(codes)), len(codes))) for e in ("checkin", "boarding", "meal")}
+        self.scanned: Dict[str, List[int]] = {e: [] for e in self.queues}
+        self.samples: Dict[str, List[float]] = {name: [] for name in self.names}
+        self.outcomes: Dict[str, Dict[str, int]] = {name: {"ok": 0, "duplicate": 0, "error": 0} for name in self.names}
+        self.errors: Dict[str, int] = {}
+        self.recording = False
+
+    def next_body(self, name: str) -> Dict[str, Any]:
+        if name == "login":
+            return {"email": FACILITATOR_EMAIL, "password": FACILITATOR_PASSWORD}
+        scanned, queue = self.scanned[name], self.queues[name]
+        if scanned and (random.random() < self.args.repeat_ratio or not queue):
+            return {"qr_code": self.codes[random.choice(scanned)]}
+        i = queue.popleft()
+        scanned.append(i)
+        return {"qr_code": self.codes[i]}
+
+    def record(self, name: str, seconds: float, status: Optional[int], content: bytes):
+        if not self.recording:
+            return
+        self.samples[name].append(seconds)
+        if status == 200 and b'"duplicate":true' not in content:
+            self.outcomes[name]["ok"] += 1
+        elif status in (200, 409):
+            self.outcomes[name]["duplicate"] += 1
+        else:
+            self.outcomes[name]["error"] += 1
+            key = f"{name} {status or 'connection error'}"
+            self.errors[key] = self.errors.get(key, 0) + 1
+
+    async def client(self, http: httpx.AsyncClient, headers: Dict[str, str], deadline: float):
+        while time.monotonic() < deadline:
+            name = random.choices(self.names, self.weights)[0]
+            body = self.next_body(name)
+            start = time.perf_counter()
+            try:
+                response = await http.post(ENDPOINTS[name], json=body, headers=None if name == "login" else headers)
+                status, content = response.status_code, response.content
+            except httpx.HTTPError:
+                status, content = None, b""
+            self.record(name, time.perf_counter() - start, status, content)
+
+
+async def drive(args, load: Load, token: str, stats_url: str):
+    """Runs the load; returns (measured seconds, PostgREST calls made while measuring)."""
+    headers = {"Authorization": f"Bearer {token}"}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.api_port}", limits=limits, timeout=30) as http:
+        start = time.monotonic()
+        deadline = start + args.warmup + args.duration
+        clients = [asyncio.create_task(load.client(http, headers, deadline)) for _ in range(args.concurrency)]
+        await asyncio.sleep(args.warmup)
+        before = (await http.get(stats_url)).json()["calls"]
+        load.recording = True
+        measured_from = time.monotonic()
+        await asyncio.gather(*clients)
+        elapsed = time.monotonic() - measured_from
+        after = (await http.get(stats_url)).json()["calls"]
+    # background work (spool flushes, roster refreshes) lands here too, so read it as an upper bound per request
+    return elapsed, {k: after[k] - before.get(k, 0) for k in sorted(after) if after[k] != before.get(k, 0)}
+
+
+# ---------------- Report ----------------
+def summarize(load: Load, elapsed: float) -> Dict[str, Any]:
+    endpoints = {}
+    for name in load.names:
+        values = sorted(load.samples[name])
+        ms = lambda v: None if v is None else round(v * 1000, 2)
+        endpoints[name] = {
+            "requests": len(values),
+            **load.outcomes[name],
+            "throughput_rps": round(len(values) / elapsed, 1),
+            "mean_ms": ms(sum(values) / len(values)) if values else None,
+            "p50_ms": ms(percentile(values, 50)),
+            "p95_ms": ms(percentile(values, 95)),
+            "p99_ms": ms(percentile(values, 99)),
+            "max_ms": ms(values[-1] if values else None),
+        }
+    requests = sum(e["requests"] for e in endpoints.values())
+    return {
+        "requests": requests,
+        "throughput_rps": round(requests / elapsed, 1),
+        "errors": sum(e["error"] for e in endpoints.values()),
+        "error_kinds": load.errors,
+        "endpoints": endpoints,
+    }
+
+
+def print_report(report: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None):
+    totals = report["totals"]
+    print(f"\n{report['revision'] or '?'}  {report['config']['concurrency']} clients, {report['elapsed_s']}s, "
+          f"{report['config']['latency_ms']}±{report['config']['jitter_ms']} ms PostgREST latency")
+    print(f"{'endpoint':<10}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'ok':>8}{'dup':>7}{'err':>6}")
+    for name, e in totals["endpoints"].items():
+        print(f"{name:<10}{e['throughput_rps']:>9}{e['p50_ms'] or '-':>9}{e['p95_ms'] or '-':>9}{e['p99_ms'] or '-':>9}"
+              f"{e['ok']:>8}{e['duplicate']:>7}{e['error']:>6}")
+    print(f"{'total':<10}{totals['throughput_rps']:>9}   errors: {totals['errors']} {totals['error_kinds'] or ''}")
+    print(f"PostgREST calls per request: {report['supabase']['calls_per_request']}  {report['supabase']['calls']}")
+    if baseline:
+        print(f"\nvs {baseline.get('revision') or 'baseline'}:")
+        for name, e in totals["endpoints"].items():
+            old = baseline["totals"]["endpoints"].get(name)
+            if not old:
+                continue
+            change = lambda new, prev: f"{(new - prev) / prev * 100:+.1f}%" if new is not None and prev else "-"
+            print(f"  {name:<10} req/s {change(e['throughput_rps'], old['throughput_rps']):>8}   "
+                  f"p99 {change(e['p99_ms'], old['p99_ms']):>8}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the scan API against a local PostgREST stand-in")
+    parser.add_argument("--concurrency", type=int, default=32, help="simultaneous clients")
+    parser.add_argument("--duration", type=float, default=20, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=3, help="seconds of load before measuring starts")
+    parser.add_argument("--mix", default="checkin=4,boarding=2,meal=3,login=1", help="endpoint=weight,...")
+    parser.add_argument("--repeat-ratio", type=float, default=0.0, help="share of scans that re-scan a scanned ticket")
+    parser.add_argument("--participants", type=int, default=20000)
+    parser.add_argument("--latency-ms", type=float, default=20, help="mean latency added to each PostgREST call")
+    parser.add_argument("--jitter-ms", type=float, default=5)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes for the API")
+    parser.add_argument("--bcrypt-rounds", type=int, default=int(os.getenv("BCRYPT_ROUNDS", "12")))
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="extra API environment")
+    parser.add_argument("--startup-timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write the report here")
+    parser.add_argument("--compare", help="earlier --json report to compare against")
+    args = parser.parse_args(argv)
+    args.fake_port, args.api_port = free_port(), free_port()
+    random.seed(args.seed)
+
+    weights = parse_mix(args.mix)
+    hashed = password_hash(args.bcrypt_rounds) if "login" in weights else None
+    if "login" in weights and not hashed:
+        weights.pop("login")
+    secret_key, qr_key, event = secrets.token_hex(32), secrets.token_hex(32), "BENCH"
+    spool_dir = tempfile.mkdtemp(prefix="bench-spool-")
+    env = {**os.environ,
+           "SUPABASE_URL": f"http://127.0.0.1:{args.fake_port}", "SUPABASE_KEY": "bench-service-key",
+           "SECRET_KEY": secret_key, "QR_SIGNING_KEY": qr_key, "EVENT_CODE": event,
+           "BCRYPT_ROUNDS": str(args.bcrypt_rounds), "EMAIL_USER": "", "EMAIL_PASS": "",
+           "ATTENDANCE_SPOOL_PATH": os.path.join(spool_dir, "attendance.jsonl")}
+    env.update(kv.split("=", 1) for kv in args.env)
+
+    codes = [sign_qr_token(f"BENCH-{i:06d}", "participant", event=event, key=qr_key.encode("utf-8"))
+             for i in range(args.participants)]
+    token = jwt.encode({"sub": FACILITATOR_EMAIL, "role": "facilitator", "exp": int(time.time()) + 86400},
+                       secret_key, algorithm="HS256")
+
+    processes = start_processes(args, hashed, env)
+    try:
+        fake_stats = f"http://127.0.0.1:{args.fake_port}/_bench/stats"
+        asyncio.run(wait_ready(fake_stats, args.startup_timeout, processes))
+        asyncio.run(wait_ready(f"http://127.0.0.1:{args.api_port}/health", args.startup_timeout, processes))
+        load = Load(args, codes, weights)
+        elapsed, calls = asyncio.run(drive(args, load, token, fake_stats))
+    finally:
+        for p in processes:
+            p.terminate()
+        for p in processes:
+            try:
+                p.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+
+    totals = summarize(load, elapsed)
+    report = {
+        "revision": git_revision(),
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "config": {k: getattr(args, k) for k in ("concurrency", "duration", "warmup", "mix", "repeat_ratio", "participants",
+                                                 "latency_ms", "jitter_ms", "workers", "bcrypt_rounds", "env", "seed")},
+        "host": {"cpus": os.cpu_count(), "python": sys.version.split()[0]},
+        "elapsed_s": round(elapsed, 2),
+        "totals": totals,
+        "supabase": {"calls": calls,
+                     "calls_per_request": round(sum(calls.values()) / totals["requests"], 2) if totals["requests"] else None},
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ report written to {args.json}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,21 @@
 # dependencies.py
-import os
+import os, time, asyncio, hashlib, threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 
+import httpx
 from dotenv import load_dotenv
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from supabase import Client, create_client
+from supabase import Client, ClientOptions, create_client
+from postgrest import AsyncPostgrestClient
 from fastapi import HTTPException, Depends
 from fastapi.security import OAuth2PasswordBearer
 
+from metrics import SUPABASE_SECONDS, stage
+
 # ---- env & clients ----
 load_dotenv()
 
@@ -18,13 +24,169 @@ SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 if not SUPABASE_URL or not SUPABASE_KEY:
     raise RuntimeError("Missing SUPABASE_URL or SUPABASE_KEY")
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# ---- Supabase call timing ----
+PREFER_OPERATIONS = {"GET": "select", "HEAD": "select", "POST": "insert", "PATCH": "update", "DELETE": "delete"}
+
+def supabase_call_labels(request: httpx.Request) -> Tuple[str, str]:
+    """(table, operation) for a PostgREST request, e.g. ("participants", "update") or ("record_scan", "rpc")."""
+    _, rest, path = request.url.path.partition("/rest/v1/")
+    if not rest:
+        # storage / auth: /storage/v1/object/... -> ("storage", "post")
+        return request.url.path.strip("/").split("/")[0], request.method.lower()
+    parts = path.split("/")
+    if parts[0] == "rpc" and len(parts) > 1:
+        return parts[1], "rpc"
+    if request.method == "POST" and "resolution=" in request.headers.get("prefer", ""):
+        return parts[0], "upsert"
+    return parts[0], PREFER_OPERATIONS.get(request.method, request.method.lower())
+
+class TimedTransport(httpx.BaseTransport):
+    """Wraps the sync client's transport; reads the body here so the timing covers the whole response."""
+
+    def __init__(self, transport: httpx.BaseTransport):
+        self._transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        start, status = time.perf_counter(), "error"
+        try:
+            response = self._transport.handle_request(request)
+            response.read()
+            status = str(response.status_code)
+            return response
+        finally:
+            SUPABASE_SECONDS.observe(time.perf_counter() - start, *supabase_call_labels(request), status)
+
+    def close(self):
+        self._transport.close()
+
+class AsyncTimedTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        start, status = time.perf_counter(), "error"
+        try:
+            response = await self._transport.handle_async_request(request)
+            await response.aread()
+            status = str(response.status_code)
+            return response
+        finally:
+            SUPABASE_SECONDS.observe(time.perf_counter() - start, *supabase_call_labels(request), status)
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+# shared by the sync PostgREST, storage and auth clients; 120s is supabase-py's own PostgREST default
+supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY, options=ClientOptions(httpx_client=httpx.Client(
+    transport=TimedTransport(httpx.HTTPTransport(http2=True)), timeout=120, follow_redirects=True)))
+
+# ---- async PostgREST client (one per process, pooled keep-alive connections) ----
+SUPABASE_POOL_SIZE = int(os.getenv("SUPABASE_POOL_SIZE", "100"))
+SUPABASE_KEEPALIVE = int(os.getenv("SUPABASE_KEEPALIVE", "20"))
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "10"))
+
+def create_async_supabase() -> AsyncPostgrestClient:
+    rest_url = f"{SUPABASE_URL.rstrip('/')}/rest/v1"
+    headers = {
+        "apikey": SUPABASE_KEY,
+        "Authorization": f"Bearer {SUPABASE_KEY}",
+        "Accept": "application/json",
+        "Content-Type": "application/json",
+    }
+    # pool limits and http2 live on the transport when one is passed in
+    transport = httpx.AsyncHTTPTransport(
+        limits=httpx.Limits(
+            max_connections=SUPABASE_POOL_SIZE,
+            max_keepalive_connections=SUPABASE_KEEPALIVE,
+            keepalive_expiry=30,
+        ),
+        http2=True,
+    )
+    http_client = httpx.AsyncClient(
+        base_url=rest_url,
+        headers=headers,
+        timeout=SUPABASE_TIMEOUT,
+        transport=AsyncTimedTransport(transport),
+        follow_redirects=True,
+    )
+    return AsyncPostgrestClient(rest_url, headers=headers, http_client=http_client)
+
+async_supabase: AsyncPostgrestClient = create_async_supabase()
+
+def get_supabase() -> Client:
+    return supabase
+
+def get_async_supabase() -> AsyncPostgrestClient:
+    return async_supabase
 
 SECRET_KEY = os.getenv("SECRET_KEY", "change_me_in_prod")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
+STREAM_TOKEN_SECONDS = int(os.getenv("STREAM_TOKEN_SECONDS", "60"))
+
+# ---- password hashing ----
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", "16"))
+PASSWORD_REHASH_ON_LOGIN = os.getenv("PASSWORD_REHASH_ON_LOGIN", "0") == "1"
+
+# min = max = default, so needs_update() flags any hash made with a different cost
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__default_rounds=BCRYPT_ROUNDS,
+                           bcrypt__min_rounds=BCRYPT_ROUNDS, bcrypt__max_rounds=BCRYPT_ROUNDS)
+
+class PasswordHasherBusy(Exception):
+    pass
+
+class PasswordHasher:
+    """
+    Runs bcrypt on its own small thread pool so a login storm cannot take the request threadpool
+    away from scans. At most workers + queue_size jobs are admitted; past that calls raise
+    PasswordHasherBusy at once instead of queueing.
+    """
+
+    def __init__(self, context: CryptContext = pwd_context, workers: int = PASSWORD_HASH_WORKERS,
+                 queue_size: int = PASSWORD_HASH_QUEUE):
+        self.context = context
+        self.capacity = workers + queue_size
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._lock = threading.Lock()
+        self.inflight = 0
+        self.rejected = 0
+
+    async def _run(self, fn, *args):
+        with self._lock:
+            if self.inflight >= self.capacity:
+                self.rejected += 1
+                raise PasswordHasherBusy(f"{self.inflight} password checks already waiting")
+            self.inflight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            with self._lock:
+                self.inflight -= 1
+
+    def _timed(self, name: str, fn):
+        def run(*args):
+            with stage(name):
+                return fn(*args)
+        return run
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    async def hash(self, password: str) -> str:
+        return await self._run(self._timed("password_hash", self.context.hash), password)
+
+    async def verify(self, password: str, password_hash: str, rehash: bool = PASSWORD_REHASH_ON_LOGIN) -> Tuple[bool, Optional[str]]:
+        """(matches, new hash or None); a new hash is only computed with rehash on and the stored cost out of date."""
+        if rehash:
+            return await self._run(self._timed("password_verify", self.context.verify_and_update), password, password_hash)
+        return await self._run(self._timed("password_verify", self.context.verify), password, password_hash), None
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"inflight": self.inflight, "capacity": self.capacity, "rejected": self.rejected}
+
+password_hasher = PasswordHasher()
 
 # This is only used by Swagger to show the lock icon; we still accept JSON at /facilitators/login
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/facilitators/login")
@@ -35,14 +197,111 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+# ---- verified-token cache ----
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "1024"))
+
+class TokenCache:
+    """
+    Claims of tokens that already passed jwt.decode, keyed by the token's sha256, so a facilitator's
+    scans skip re-verifying the same bearer token. An entry is dropped the second its exp passes
+    (same rule as jose: rejected once exp < now), and tokens without exp are never cached.
+    revoke() makes a token fail verification until it expires; revocations are per process.
+    """
+
+    def __init__(self, max_size: int = TOKEN_CACHE_SIZE):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._claims: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._revoked: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            claims = self._claims.get(key)
+            if claims is not None and int(claims["exp"]) < int(time.time()):
+                del self._claims[key]
+                claims = None
+            if claims is None:
+                self.misses += 1
+                return None
+            self._claims.move_to_end(key)
+            self.hits += 1
+            return dict(claims)
+
+    def put(self, key: str, claims: Dict[str, Any]):
+        if self.max_size <= 0 or "exp" not in claims:
+            return
+        with self._lock:
+            self._claims[key] = dict(claims)
+            self._claims.move_to_end(key)
+            while len(self._claims) > self.max_size:
+                self._claims.popitem(last=False)
+
+    def is_revoked(self, key: str) -> bool:
+        with self._lock:
+            return key in self._revoked
+
+    def revoke(self, token: str):
+        key = self.key(token)
+        try:
+            exp = int(jwt.get_unverified_claims(token).get("exp") or 0)
+        except JWTError:
+            exp = 0
+        now = int(time.time())
+        with self._lock:
+            self._claims.pop(key, None)
+            # keep tombstones only as long as the token could still verify
+            self._revoked = {k: e for k, e in self._revoked.items() if e >= now}
+            self._revoked[key] = exp or now + ACCESS_TOKEN_EXPIRE_MINUTES * 60
+
+    def clear(self):
+        with self._lock:
+            self._claims.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"size": len(self._claims), "revoked": len(self._revoked), "hits": self.hits, "misses": self.misses}
+
+token_cache = TokenCache()
+
 def verify_access_token(token: str) -> Optional[Dict[str, Any]]:
+    key = TokenCache.key(token)
+    if token_cache.is_revoked(key):
+        return None
+    claims = token_cache.get(key)
+    if claims is not None:
+        return claims
     try:
-        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        with stage("jwt_decode"):
+            claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     except JWTError:
         return None
+    token_cache.put(key, claims)
+    return claims
 
-def get_current_facilitator(token: str = Depends(oauth2_scheme)) -> Dict[str, Any]:
+# async so FastAPI runs it on the event loop instead of borrowing a threadpool worker per request
+async def get_current_facilitator(token: str = Depends(oauth2_scheme)) -> Dict[str, Any]:
     payload = verify_access_token(token)
     if not payload or payload.get("role") != "facilitator":
         raise HTTPException(status_code=401, detail="Invalid or expired token")
     return payload
+
+# ---- stream tokens ----
+# EventSource cannot send headers, so the live feed's token travels in the URL, where proxies and access logs
+# record it. It gets its own short-lived token whose role is refused everywhere else.
+STREAM_ROLE = "stream"
+
+def create_stream_token(facilitator: Dict[str, Any]) -> str:
+    return create_access_token({"sub": facilitator.get("sub"), "role": STREAM_ROLE},
+                               timedelta(seconds=STREAM_TOKEN_SECONDS))
+
+async def get_stream_viewer(token: str) -> Dict[str, Any]:
+    payload = verify_access_token(token)
+    if not payload or payload.get("role") != STREAM_ROLE:
+        raise HTTPException(status_code=401, detail="Invalid or expired stream token")
+    return payload
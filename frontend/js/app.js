@@ -140,10 +140,12 @@ document.querySelectorAll(".sidebar a").forEach((link) => {
     e.preventDefault();
     const page = link.dataset.page;
     document.getElementById("page-content").innerHTML = "";
+    if (liveFeed) { liveFeed.close(); liveFeed = null; }
 
     if (page === "bus") renderScannerPage("Bus Boarding", "/boarding");
     else if (page === "registration") renderScannerPage("Check-In", "/checkin");
     else if (page === "meals") renderScannerPage("Meal Collection", "/meals");
+    else if (page === "reports") renderReportsPage();
     else document.getElementById("page-content").innerHTML =
       `<h2>${page}</h2><p>Loading content...</p>`;
 
@@ -158,6 +160,62 @@ document.addEventListener("click", (e) => {
   }
 });
 
+// -------------------------------
+// Live Reports
+// -------------------------------
+let liveFeed;
+
+function renderReportsPage() {
+  const token = getToken();
+  if (!token) {
+    Swal.fire("Error", "No token found. Please log in.", "error");
+    return;
+  }
+  document.getElementById("page-content").innerHTML = `
+    <h2>Live Attendance</h2>
+    <div id="live-totals" style="margin:10px 0; font-weight:bold;">Connecting...</div>
+    <ul id="live-recent"></ul>
+  `;
+
+  openLiveFeed(token).catch((err) => Swal.fire("Error", err.message, "error"));
+}
+
+async function openLiveFeed(token) {
+  // the feed URL carries a short-lived stream-only token, never the login token: URLs end up in access logs
+  const res = await fetch(`${API_URL}/live/attendance/stream-token`, {
+    method: "POST",
+    headers: { Authorization: "Bearer " + token },
+  });
+  const body = await res.json();
+  if (!res.ok) throw new Error(body.detail || "Could not open the live feed");
+  if (liveFeed || !document.getElementById("live-recent")) return; // navigated away, or already reopened
+
+  // pushed by the API whenever a scan is recorded
+  const feed = (liveFeed = new EventSource(`${API_URL}/live/attendance/stream?token=${encodeURIComponent(body.stream_token)}`));
+  feed.onmessage = (e) => {
+    const data = JSON.parse(e.data);
+    const t = data.totals;
+    document.getElementById("live-totals").textContent =
+      `Participants: ${data.participants ?? "-"} | Checked in: ${t.checkin} | Boarded: ${t.boarding} | Meals: ${t.meal}`;
+    // names come from the roster: text nodes only, never innerHTML
+    const items = data.recent.map((s) => {
+      const li = document.createElement("li");
+      li.textContent = `${new Date(s.at).toLocaleTimeString()} - ${s.full_name || s.participant_id} (${s.event_type})`;
+      return li;
+    });
+    document.getElementById("live-recent").replaceChildren(...items);
+  };
+  // the stream token has usually expired by the time EventSource would reconnect, so fetch a new one
+  feed.onerror = () => {
+    feed.close();
+    if (liveFeed !== feed) return;
+    liveFeed = null;
+    setTimeout(() => {
+      if (!liveFeed && document.getElementById("live-recent")) openLiveFeed(token).catch(() => {});
+    }, 3000);
+  };
+}
+
 // -------------------------------
 // QR Scanner
 // -------------------------------
@@ -194,28 +252,14 @@ function startScanner(endpoint) {
         console.log("POSTing QR scan to:", API_URL + endpoint);
 
         try {
-          const parts = decodedText.split("|");
-          if (parts.length < 2) throw new Error("Invalid QR format");
-          const email = parts[1].trim();
-
-          const idRes = await fetch(`${API_URL}/participant-id?email=${encodeURIComponent(email)}`, {
-            headers: { Authorization: "Bearer " + token },
-          });
-
-          if (!idRes.ok) {
-            const errData = await idRes.json();
-            throw new Error(errData.detail || "Participant not found");
-          }
-
-          const { participant_id } = await idRes.json();
-
+          // the API validates the code itself (signed ticket token or legacy name|email|type|code)
           const res = await fetch(`${API_URL}${endpoint}`, {
             method: "POST",
             headers: {
               "Content-Type": "application/json",
               Authorization: "Bearer " + token,
             },
-            body: JSON.stringify({ participant_id, qr_data: decodedText }),
+            body: JSON.stringify({ qr_code: decodedText }),
           });
 
           const data = await res.json();
@@ -0,0 +1,94 @@
+# live_stats.py
+import os, json, asyncio
+from collections import deque
+from datetime import datetime
+from typing import Optional, Dict, Any, Iterable, AsyncIterator, Callable
+
+LIVE_PUSH_SECONDS = float(os.getenv("LIVE_PUSH_SECONDS", "1"))
+LIVE_RECENT_SCANS = int(os.getenv("LIVE_RECENT_SCANS", "20"))
+LIVE_KEEPALIVE_SECONDS = float(os.getenv("LIVE_KEEPALIVE_SECONDS", "15"))
+
+
+class LiveAttendance:
+    """
+    Running attendance totals for the dashboard feed, kept in memory and updated by the scan handlers.
+    totals[event] counts distinct participants, scans[event] every accepted scan; recent holds the latest scans.
+    The JSON payload is built once per change and shared by every viewer, and pushed at most every push_seconds,
+    so viewers cost neither queries nor per-viewer encoding. Counters are per process.
+    """
+
+    def __init__(self, event_types: Iterable[str], push_seconds: float = LIVE_PUSH_SECONDS,
+                 recent: int = LIVE_RECENT_SCANS, keepalive_seconds: float = LIVE_KEEPALIVE_SECONDS,
+                 participants: Optional[Callable[[], int]] = None):
+        self.event_types = tuple(event_types)
+        self.push_seconds = push_seconds
+        self.keepalive_seconds = keepalive_seconds
+        self._participants = participants
+        self._seen: Dict[str, set] = {e: set() for e in self.event_types}
+        self.scans: Dict[str, int] = {e: 0 for e in self.event_types}
+        self.recent = deque(maxlen=recent)
+        self.version = 0
+        self.viewers = 0
+        self._payload: Optional[str] = None
+        self._payload_version = -1
+        self._changed = asyncio.Event()
+
+    def seed(self, participants: Iterable[Dict[str, Any]], status_columns: Dict[str, str]):
+        """Starting totals from rows already loaded (the roster cache), instead of count(*) queries."""
+        for row in participants:
+            for event_type, column in status_columns.items():
+                if row.get(column):
+                    self._seen[event_type].add(row["participant_id"])
+        self._bump()
+
+    def record(self, event_type: str, participant_id: str, full_name: Optional[str] = None, at: Optional[str] = None):
+        self._seen[event_type].add(participant_id)
+        self.scans[event_type] += 1
+        self.recent.appendleft({
+            "event_type": event_type,
+            "participant_id": participant_id,
+            "full_name": full_name,
+            "at": at or datetime.utcnow().isoformat(),
+        })
+        self._bump()
+
+    def _bump(self):
+        self.version += 1
+        # wake everyone waiting on the current event; later waiters get a fresh one
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "participants": self._participants() if self._participants else None,
+            "totals": {e: len(seen) for e, seen in self._seen.items()},
+            "scans": dict(self.scans),
+            "recent": list(self.recent),
+            "viewers": self.viewers,
+        }
+
+    def payload(self) -> str:
+        if self._payload_version != self.version:
+            self._payload = json.dumps(self.snapshot())
+            self._payload_version = self.version
+        return self._payload
+
+    async def stream(self) -> AsyncIterator[str]:
+        """Server-sent events: the current totals at once, then again after every change (coalesced)."""
+        self.viewers += 1
+        try:
+            sent = -1
+            while True:
+                if self.version != sent:
+                    sent = self.version
+                    yield f"id: {sent}\ndata: {self.payload()}\n\n"
+                    await asyncio.sleep(self.push_seconds)
+                    continue
+                try:
+                    await asyncio.wait_for(self._changed.wait(), self.keepalive_seconds)
+                except asyncio.TimeoutError:
+                    # comment line: keeps proxies from closing an idle stream
+                    yield ": keepalive\n\n"
+        finally:
+            self.viewers -= 1
@@ -1,17 +1,66 @@
 # main.py
-from fastapi import FastAPI, Depends, HTTPException, Body, Query
+from fastapi import FastAPI, Depends, HTTPException, Body, Query, Header
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import Response, StreamingResponse, JSONResponse, PlainTextResponse
 from pydantic import BaseModel, EmailStr
-from datetime import datetime
-from typing import Optional
-import os, uuid, qrcode, smtplib
+from datetime import datetime, timezone
+from typing import Optional, List, Literal, Tuple, Iterable, Dict
+import os, uuid, asyncio
 from email.message import EmailMessage
-from PIL import Image, ImageDraw, ImageFont
-
-from dependencies import supabase, pwd_context, create_access_token, get_current_facilitator
-
-app = FastAPI(title="NWU Hackathon Access System")
+from contextlib import asynccontextmanager
+
+from dependencies import (supabase, async_supabase, create_access_token, get_current_facilitator, oauth2_scheme, token_cache,
+                          password_hasher, PasswordHasherBusy, create_stream_token, get_stream_viewer, STREAM_TOKEN_SECONDS)
+from roster_cache import RosterCache
+from attendance_spool import AttendanceSpool
+from live_stats import LiveAttendance
+from analytics import AttendanceRollups
+from scan_guard import ScanGuard
+from metrics import registry, stage, MetricsMiddleware
+from ticket_render import TicketRenderService, RenderQueueFull, ticket_path, render_ticket_png
+from ticket_export import stream_ticket_zip, render_ticket_pdf, EXPORT_FORMATS
+from qr_token import verify_qr_token, is_signed_token, InvalidQRToken, QR_ACCEPT_LEGACY
+from backend.services.smtp_pool import SMTPPool
+
+# ---------------- Roster Cache / Attendance Spool / Ticket Renderer / Live Totals ----------------
+roster = RosterCache(supabase)
+attendance_spool = AttendanceSpool()
+renderer = TicketRenderService()
+live = LiveAttendance(("checkin", "boarding", "meal"), participants=lambda: roster.stats()["participants"])
+rollups = AttendanceRollups(("checkin", "boarding", "meal"))
+scan_guard = ScanGuard()
+
+async def rebuild_rollups():
+    try:
+        await run_in_threadpool(rollups.rebuild, supabase)
+    except Exception as e:
+        print(f"[analytics] rollup rebuild failed: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await run_in_threadpool(roster.start)
+    participants = roster.select()
+    live.seed(participants, {event_type: cols[0] for event_type, cols in SCAN_EVENTS.items()})
+    scan_guard.seed(participants, {event_type: cols[1] for event_type, cols in SCAN_EVENTS.items()})
+    app.state.rollup_rebuild = asyncio.create_task(rebuild_rollups())
+    attendance_spool.start(async_supabase)
+    renderer.start()
+    yield
+    roster.stop()
+    renderer.shutdown()
+    password_hasher.shutdown()
+    mailer.close()
+    await attendance_spool.stop()
+    await async_supabase.aclose()
+
+class TimedJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        with stage("serialize"):
+            return super().render(content)
+
+app = FastAPI(title="NWU Hackathon Access System", lifespan=lifespan, default_response_class=TimedJSONResponse)
 
 # ---------------- CORS ----------------
 app.add_middleware(
@@ -20,15 +69,22 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# roster snapshots run to thousands of rows; small responses are left as they are
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+# added last so it is outermost and its timings include the other middleware
+app.add_middleware(MetricsMiddleware)
 
 # ---------------- Email Setup ----------------
 SMTP_EMAIL = os.getenv("EMAIL_USER")
 SMTP_PASSWORD = os.getenv("EMAIL_PASS")
 SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
 SMTP_PORT = int(os.getenv("SMTP_PORT") or 587)
+mailer = SMTPPool(SMTP_SERVER, SMTP_PORT, SMTP_EMAIL, SMTP_PASSWORD)
 
-def send_email(to_email: str, subject: str, body: str, attachment_path: Optional[str] = None):
-    if not (SMTP_EMAIL and SMTP_PASSWORD):
+def send_email(to_email: str, subject: str, body: str, attachment_path: Optional[str] = None,
+               attachment: Optional[Tuple[str, bytes]] = None):
+    """attachment is (filename, PNG bytes), for tickets rendered in memory instead of read from disk."""
+    if not mailer.configured:
         return
     msg = EmailMessage()
     msg["Subject"] = subject
@@ -39,42 +95,11 @@ def send_email(to_email: str, subject: str, body: str, attachment_path: Optional
         with open(attachment_path, "rb") as f:
             msg.add_attachment(f.read(), maintype="application", subtype="octet-stream",
                                filename=os.path.basename(attachment_path))
-    with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-        server.starttls()
-        server.login(SMTP_EMAIL, SMTP_PASSWORD)
-        server.send_message(msg)
-
-# ---------------- Ticket Generation ----------------
-def generate_ticket(name: str, email: str, participant_type: str, event_code: str) -> str:
-    qr_data = f"{name}|{email}|{participant_type}|{event_code}"
-    qr = qrcode.QRCode(box_size=10, border=4)
-    qr.add_data(qr_data)
-    qr.make(fit=True)
-    qr_img = qr.make_image(fill_color="black", back_color="white").convert("RGB")
-
-    w, h = 600, 400
-    ticket = Image.new("RGB", (w, h), "white")
-    draw = ImageDraw.Draw(ticket)
-    try:
-        font = ImageFont.truetype("arial.ttf", size=24)
-    except Exception:
-        font = ImageFont.load_default()
-
-    draw.text((20, 20), f"Name: {name}", fill="black", font=font)
-    draw.text((20, 60), f"Email: {email}", fill="black", font=font)
-    draw.text((20, 100), f"Type: {participant_type}", fill="black", font=font)
-    draw.text((20, 140), f"Event: {os.getenv('EVENT_NAME','NWU Hackathon')}", fill="black", font=font)
-    draw.text((20, 180), f"Date: {os.getenv('EVENT_DATE','2025-01-01')}", fill="black", font=font)
-    draw.text((20, 220), f"Code: {event_code}", fill="black", font=font)
-
-    qr_img = qr_img.resize((200, 200))
-    ticket.paste(qr_img, (w - 220, h - 220))
-
-    os.makedirs("tickets", exist_ok=True)
-    safe_email = email.replace("@", "_at_")
-    path = os.path.join("tickets", f"{name}_{safe_email}.png")
-    ticket.save(path)
-    return path
+    if attachment:
+        filename, data = attachment
+        msg.add_attachment(data, maintype="image", subtype="png", filename=filename)
+    with stage("smtp_send"):
+        mailer.send(msg)
 
 # ---------------- Models ----------------
 class FacilitatorSignup(BaseModel):
@@ -93,95 +118,254 @@ class Participant(BaseModel):
 class QRData(BaseModel):
     qr_code: str
 
+class QueuedScan(QRData):
+    event_type: Literal["checkin", "boarding", "meal"]
+    scanned_at: Optional[datetime] = None  # client clock at scan time; defaults to arrival time
+
+class ScanBatch(BaseModel):
+    scans: List[QueuedScan]
+
+def as_utc(ts: datetime) -> datetime:
+    """Client clocks may or may not send an offset; naive times are taken as UTC."""
+    return ts.replace(tzinfo=timezone.utc) if ts.tzinfo is None else ts.astimezone(timezone.utc)
+
 # ---------------- Auth Endpoints ----------------
+def hasher_busy() -> HTTPException:
+    return HTTPException(status_code=503, detail="Too many logins at once, try again in a few seconds",
+                         headers={"Retry-After": "2"})
+
+async def hash_password(password: str) -> str:
+    try:
+        return await password_hasher.hash(password)
+    except PasswordHasherBusy:
+        raise hasher_busy()
+
 @app.post("/facilitators/signup")
-def facilitator_signup(data: FacilitatorSignup):
-    res = supabase.table("profiles").select("*").eq("email", data.email).eq("role", "facilitator").execute()
+async def facilitator_signup(data: FacilitatorSignup):
+    res = await async_supabase.table("profiles").select("*").eq("email", data.email).eq("role", "facilitator").execute()
     profile = res.data[0] if res.data else None
     if profile and profile.get("password_hash"):
         raise HTTPException(status_code=400, detail="Password already set. Please log in.")
 
-    password_hash = pwd_context.hash(data.password)
+    password_hash = await hash_password(data.password)
     if profile:
-        supabase.table("profiles").update({"password_hash": password_hash}).eq("email", data.email).eq("role", "facilitator").execute()
+        await async_supabase.table("profiles").update({"password_hash": password_hash}).eq("email", data.email).eq("role", "facilitator").execute()
     else:
-        supabase.table("profiles").insert({"email": data.email, "role": "facilitator", "password_hash": password_hash}).execute()
+        await async_supabase.table("profiles").insert({"email": data.email, "role": "facilitator", "password_hash": password_hash}).execute()
     return {"message": "Facilitator account ready."}
 
 @app.post("/facilitators/login")
-def facilitator_login(data: FacilitatorLogin):
-    res = supabase.table("profiles").select("*").eq("email", data.email).eq("role", "facilitator").execute()
+async def facilitator_login(data: FacilitatorLogin):
+    res = await async_supabase.table("profiles").select("*").eq("email", data.email).eq("role", "facilitator").execute()
     profile = res.data[0] if res.data else None
-    if not profile or not profile.get("password_hash") or not pwd_context.verify(data.password, profile["password_hash"]):
+    if not profile or not profile.get("password_hash"):
         raise HTTPException(status_code=401, detail="Invalid email or password")
+    try:
+        ok, new_hash = await password_hasher.verify(data.password, profile["password_hash"])
+    except PasswordHasherBusy:
+        raise hasher_busy()
+    if not ok:
+        raise HTTPException(status_code=401, detail="Invalid email or password")
+    if new_hash:
+        # BCRYPT_ROUNDS changed since this hash was made (PASSWORD_REHASH_ON_LOGIN=1)
+        await async_supabase.table("profiles").update({"password_hash": new_hash}).eq("email", profile["email"]).eq("role", "facilitator").execute()
     token = create_access_token({"sub": profile["email"], "role": profile["role"]})
     return {"access_token": token, "token_type": "bearer"}
 
+@app.post("/facilitators/logout")
+async def facilitator_logout(token: str = Depends(oauth2_scheme), _=Depends(get_current_facilitator)):
+    token_cache.revoke(token)
+    return {"message": "Logged out."}
+
 @app.get("/facilitators/me")
-def whoami(current=Depends(get_current_facilitator)):
+async def whoami(current=Depends(get_current_facilitator)):
     return {"email": current.get("sub"), "role": current.get("role")}
 
 # ---------------- Participant Helpers ----------------
-@app.get("/participant-id")
-def get_participant_id(email: str = Query(...), _=Depends(get_current_facilitator)):
-    pres = supabase.table("participants").select("participant_id").eq("email", email).execute()
+async def find_participant(email: str) -> Optional[dict]:
+    participant = roster.get_by_email(email)
+    if participant:
+        return participant
+    pres = await async_supabase.table("participants").select("*").eq("email", email).execute()
     participant = pres.data[0] if pres.data else None
+    if participant:
+        roster.upsert(participant)
+    return participant
+
+@app.get("/participant-id")
+async def get_participant_id(email: str = Query(...), _=Depends(get_current_facilitator)):
+    participant = await find_participant(email)
     if not participant:
         raise HTTPException(status_code=404, detail="Participant not found")
     return {"participant_id": participant["participant_id"]}
 
+async def ensure_roster():
+    if not roster.warmed:
+        try:
+            await run_in_threadpool(roster.refresh)
+        except Exception as e:
+            raise HTTPException(status_code=503, detail=f"Roster not loaded yet: {e}", headers={"Retry-After": "5"})
+
+@app.get("/roster/snapshot")
+async def roster_snapshot(since: Optional[str] = Query(None), _=Depends(get_current_facilitator)):
+    """Participants and their scan flags for scanner devices; pass the last version seen as since to get only changes."""
+    await ensure_roster()
+    return roster.snapshot(since)
+
 # ---------------- Participant Management ----------------
-@app.post("/participants")
-def add_participant(data: Participant, _=Depends(get_current_facilitator)):
+@app.post("/participants", status_code=202)
+async def add_participant(data: Participant, _=Depends(get_current_facilitator)):
+    if renderer.full():
+        raise HTTPException(status_code=503, detail="Ticket renderer is busy, try again shortly",
+                            headers={"Retry-After": "5"})
     new_id = str(uuid.uuid4())
-    ticket_path = generate_ticket(data.name, data.email, data.participant_type, new_id)
+    ticket_uuid = str(uuid.uuid4())
 
-    supabase.table("participants").insert({
+    roster.invalidate(email=data.email)
+    pres = await async_supabase.table("participants").insert({
         "participant_id": new_id,
         "full_name": data.name,
         "email": data.email,
+        "role": (data.participant_type or "Participant").lower(),
         "registration_status": "Registered"
     }).execute()
+    if pres.data:
+        roster.upsert(pres.data[0], ticket_uuid=ticket_uuid)
 
-    supabase.table("tickets").insert({
+    await async_supabase.table("tickets").insert({
         "participant_id": new_id,
-        "ticket_uuid": str(uuid.uuid4()),
-        "pdf_path": ticket_path
+        "ticket_uuid": ticket_uuid,
+        "pdf_path": ticket_path(data.name, data.email),
+        "render_status": "pending"
     }).execute()
 
-    send_email(data.email, f"Your {os.getenv('EVENT_NAME','NWU Hackathon')} Ticket", "Here is your ticket.", ticket_path)
-    return {"message": "Participant added and ticket emailed.", "participant_id": new_id}
-
-@app.get("/tickets/{email}")
-def download_ticket(email: EmailStr, _=Depends(get_current_facilitator)):
-    pres = supabase.table("participants").select("*").eq("email", email).execute()
-    participant = pres.data[0] if pres.data else None
+    participant = {"participant_id": new_id, "full_name": data.name, "email": data.email, "role": data.participant_type}
+    try:
+        queue_ticket_render(participant)
+    except RenderQueueFull:
+        # the rows are committed, so retrying this request would add the participant twice
+        await set_render_status(new_id, "failed")
+        return {
+            "message": "Participant added, but the ticket renderer is busy; re-queue the ticket to email it.",
+            "participant_id": new_id,
+            "ticket_status": "failed",
+            "render_url": f"/tickets/{data.email}/render",
+        }
+
+    return {
+        "message": "Participant added; ticket will be emailed once rendered.",
+        "participant_id": new_id,
+        "ticket_status": "pending",
+    }
+
+async def set_render_status(participant_id: str, status: str):
+    await async_supabase.table("tickets").update({"render_status": status}).eq("participant_id", participant_id).execute()
+
+def queue_ticket_render(participant: dict):
+    """Renders the ticket in the background and emails it once ready; raises RenderQueueFull when the queue is full."""
+    async def ticket_rendered(participant_id: str, job: dict):
+        await set_render_status(participant_id, job["status"])
+        if job["status"] == "ready":
+            await run_in_threadpool(send_email, participant["email"], f"Your {os.getenv('EVENT_NAME','NWU Hackathon')} Ticket",
+                                    "Here is your ticket.", job["path"])
+
+    renderer.submit(participant["participant_id"], *ticket_fields(participant), on_done=ticket_rendered)
+
+@app.post("/tickets/{email}/render", status_code=202)
+async def requeue_ticket_render(email: EmailStr, _=Depends(get_current_facilitator)):
+    """Queues the ticket render and email again, e.g. after add_participant answered ticket_status "failed"."""
+    participant = await find_participant(email)
+    if not participant:
+        raise HTTPException(status_code=404, detail="Participant not found")
+    busy = HTTPException(status_code=503, detail="Ticket renderer is busy, try again shortly", headers={"Retry-After": "5"})
+    if renderer.full():
+        raise busy
+    # before submitting, so a quick render's "ready" is not overwritten
+    await set_render_status(participant["participant_id"], "pending")
+    try:
+        queue_ticket_render(participant)
+    except RenderQueueFull:
+        await set_render_status(participant["participant_id"], "failed")
+        raise busy
+    return {"participant_id": participant["participant_id"], "ticket_status": "pending"}
+
+@app.get("/tickets/{email}/status")
+async def ticket_status(email: EmailStr, _=Depends(get_current_facilitator)):
+    participant = await find_participant(email)
     if not participant:
         raise HTTPException(status_code=404, detail="Participant not found")
 
-    tres = supabase.table("tickets").select("pdf_path").eq("participant_id", participant["participant_id"]).execute()
+    job = renderer.status(participant["participant_id"])
+    if job:
+        return {"participant_id": participant["participant_id"], "ticket_status": job["status"]}
+
+    tres = await async_supabase.table("tickets").select("render_status").eq("participant_id", participant["participant_id"]).execute()
     ticket = tres.data[0] if tres.data else None
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket not found")
+    return {"participant_id": participant["participant_id"], "ticket_status": ticket.get("render_status") or "ready"}
+
+def ticket_fields(participant: dict) -> tuple:
+    """(name, email, type, code) a participant's ticket is rendered from; the same row always gives the same ticket."""
+    return (participant.get("full_name") or "", participant["email"], (participant.get("role") or "participant").title(),
+            participant["participant_id"])
+
+@app.get("/tickets/export")
+async def export_tickets(role: Optional[str] = None, registration_status: Optional[str] = None,
+                         fmt: Literal["png", "pdf", "both"] = Query("both", alias="format"),
+                         _=Depends(get_current_facilitator)):
+    """Every (matching) participant's tickets as one ZIP, rendered and written out while the response streams."""
+    await ensure_roster()
+    participants = roster.select(role=role, registration_status=registration_status)
+    if not participants:
+        raise HTTPException(status_code=404, detail="No participants match")
+
+    async def render(participant: dict, ext: str) -> bytes:
+        if ext == "png":
+            return await renderer.run(render_ticket_png, *ticket_fields(participant))
+        return await renderer.run(render_ticket_pdf, participant.get("full_name") or "", participant.get("student_number") or "",
+                                  participant["participant_id"], participant.get("role") or "participant")
+
+    return StreamingResponse(
+        stream_ticket_zip(participants, render, EXPORT_FORMATS[fmt], lookahead=renderer.workers * 2),
+        media_type="application/zip",
+        # already compressed: keep GZipMiddleware off it
+        headers={"Content-Disposition": 'attachment; filename="tickets.zip"', "Content-Encoding": "identity"},
+    )
+
+@app.get("/tickets/{email}")
+async def download_ticket(email: EmailStr, if_none_match: Optional[str] = Header(None), _=Depends(get_current_facilitator)):
+    """Rendered from the participant row on demand (no file on disk needed), cached, and revalidated by ETag."""
+    participant = await find_participant(email)
+    if not participant:
+        raise HTTPException(status_code=404, detail="Participant not found")
 
-    path = ticket["pdf_path"]
-    if not os.path.exists(path):
-        raise HTTPException(status_code=404, detail="Ticket file missing on server")
-    return FileResponse(path, media_type="image/png")
+    fields = ticket_fields(participant)
+    etag = renderer.etag(*fields)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if if_none_match and etag in (t.strip() for t in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+    try:
+        etag, png = await renderer.render_png(*fields)
+    except RenderQueueFull:
+        raise HTTPException(status_code=503, detail="Ticket renderer is busy, try again shortly", headers={"Retry-After": "5"})
+    headers["ETag"] = etag
+    return Response(png, media_type="image/png", headers=headers)
 
 @app.post("/tickets/resend")
-def resend_ticket(email: EmailStr = Body(..., embed=True), _=Depends(get_current_facilitator)):
-    pres = supabase.table("participants").select("*").eq("email", email).execute()
-    participant = pres.data[0] if pres.data else None
+async def resend_ticket(email: EmailStr = Body(..., embed=True), _=Depends(get_current_facilitator)):
+    participant = await find_participant(email)
     if not participant:
         raise HTTPException(status_code=404, detail="Participant not found")
 
-    tres = supabase.table("tickets").select("pdf_path").eq("participant_id", participant["participant_id"]).execute()
-    ticket = tres.data[0] if tres.data else None
-    if not ticket:
-        raise HTTPException(status_code=404, detail="Ticket not found")
+    # rendered from the participant row like GET /tickets/{email}: another instance's disk may hold the only file
+    try:
+        _, png = await renderer.render_png(*ticket_fields(participant))
+    except RenderQueueFull:
+        raise HTTPException(status_code=503, detail="Ticket renderer is busy, try again shortly", headers={"Retry-After": "5"})
 
-    send_email(email, "Your Hackathon Ticket", "Resending your ticket.", ticket["pdf_path"])
+    await run_in_threadpool(send_email, email, "Your Hackathon Ticket", "Resending your ticket.",
+                            attachment=(f"ticket_{participant['participant_id']}.png", png))
     return {"message": "Ticket resent."}
 
 # ---------------- QR Utilities ----------------
@@ -192,71 +376,279 @@ def extract_email_from_qr(qr_code: str) -> str:
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid QR code format")
 
-def log_attendance(participant_id: str, event_type: str):
+def parse_scan_code(qr_code: str) -> Tuple[str, str]:
+    """
+    Validates a scanned code without touching the database.
+    Signed tokens give ("participant_id", id); legacy name|email|type|code tickets give ("email", email)
+    while QR_ACCEPT_LEGACY is on.
+    """
+    if is_signed_token(qr_code):
+        try:
+            claims = verify_qr_token(qr_code)
+        except InvalidQRToken as e:
+            raise HTTPException(status_code=403 if e.reason in ("expired", "event") else 400, detail=str(e))
+        return "participant_id", claims["participant_id"]
+    if not QR_ACCEPT_LEGACY:
+        raise HTTPException(status_code=400, detail="Unsigned ticket codes are no longer accepted")
+    return "email", extract_email_from_qr(qr_code)
+
+# event_type -> (status column, timestamp column, message suffix)
+SCAN_EVENTS = {
+    "checkin": ("checkin_status", "checkin_timestamp", "checked in."),
+    "boarding": ("transport_status", "transport_timestamp", "boarded the bus."),
+    "meal": ("meal_status", "meal_timestamp", "collected a meal."),
+}
+
+# repeats of these are refused; repeats of the others are answered from memory as already done
+QUOTA_EVENTS = ("meal",)
+
+def duplicate_scan(event_type: str, participant: dict, previous: List[str]) -> dict:
+    """Response for a scan the guard stopped; raises 409 for quota events."""
+    name = participant.get("full_name") or participant["participant_id"]
+    if event_type in QUOTA_EVENTS:
+        quota, window = scan_guard.rules[event_type]
+        raise HTTPException(status_code=409, detail=f"{name} already collected {len(previous)} meal(s) "
+                                                    f"in the last {window / 3600:g}h (limit {quota}).")
+    return {"message": f"{name} already {SCAN_EVENTS[event_type][2]}", "duplicate": True, "previous_scans": previous}
+
+async def record_scan(qr_code: str, event_type: str) -> dict:
+    """
+    Lookup, status update and attendance log in one round trip via the record_scan procedure (supabase/schema.sql).
+    Participants in the roster cache are checked against the scan guard first, so repeats cost no round trip.
+    """
+    key, value = parse_scan_code(qr_code)
+    scanned_at = datetime.utcnow().isoformat()
+    known = roster.get_by_id(value) if key == "participant_id" else roster.get_by_email(value)
+    if known:
+        previous = scan_guard.claim(event_type, known["participant_id"], scanned_at)
+        if previous:
+            return duplicate_scan(event_type, known, previous)
     try:
-        supabase.table("attendance_logs").insert({
-            "participant_id": participant_id,
-            "event_type": event_type,
-            "status": True,
-            "timestamp": datetime.utcnow().isoformat()
+        res = await async_supabase.rpc("record_scan", {
+            "p_event_type": event_type,
+            "p_" + key: value,
+            "p_scanned_at": scanned_at
         }).execute()
+        participant = res.data[0] if res.data else None
+        if not participant:
+            raise HTTPException(status_code=404, detail="Participant not found")
     except Exception:
-        pass  # Non-critical, just log
+        if known:
+            scan_guard.release(event_type, known["participant_id"], scanned_at)
+        raise
+    if not known:
+        # not cached yet: nothing to check against beforehand, remember it for the next scan
+        scan_guard.claim(event_type, participant["participant_id"], scanned_at)
+
+    status_col, ts_col, suffix = SCAN_EVENTS[event_type]
+    roster.patch(participant["participant_id"], {status_col: True, ts_col: scanned_at})
+    scan_recorded(event_type, participant["participant_id"], participant.get("full_name"), scanned_at)
+    return {"message": f"{participant['full_name']} {suffix}"}
+
+def scan_recorded(event_type: str, participant_id: str, full_name: Optional[str], at: str):
+    """Feeds an accepted scan to the in-memory live totals and analytics rollups."""
+    live.record(event_type, participant_id, full_name, at)
+    rollups.add(event_type, participant_id, at)
 
 # ---------------- QR Endpoints ----------------
 @app.post("/checkin")
-def checkin(data: QRData, _=Depends(get_current_facilitator)):
-    email = extract_email_from_qr(data.qr_code)
-    pres = supabase.table("participants").select("*").eq("email", email).execute()
-    participant = pres.data[0] if pres.data else None
-    if not participant:
-        raise HTTPException(status_code=404, detail="Participant not found")
-
-    supabase.table("participants").update({
-        "checkin_status": True,
-        "checkin_timestamp": datetime.utcnow().isoformat()
-    }).eq("participant_id", participant["participant_id"]).execute()
-    log_attendance(participant["participant_id"], "checkin")
-
-    return {"message": f"{participant['full_name']} checked in."}
+async def checkin(data: QRData, _=Depends(get_current_facilitator)):
+    return await record_scan(data.qr_code, "checkin")
 
 @app.post("/boarding")
-def boarding_qr(data: QRData, _=Depends(get_current_facilitator)):
-    email = extract_email_from_qr(data.qr_code)
-    pres = supabase.table("participants").select("participant_id","full_name").eq("email", email).execute()
-    participant = pres.data[0] if pres.data else None
-    if not participant:
-        raise HTTPException(status_code=404, detail="Participant not found")
-
-    supabase.table("participants").update({
-        "transport_status": True,
-        "transport_timestamp": datetime.utcnow().isoformat()
-    }).eq("participant_id", participant["participant_id"]).execute()
-    log_attendance(participant["participant_id"], "boarding")
-
-    return {"message": f"{participant['full_name']} boarded the bus."}
+async def boarding_qr(data: QRData, _=Depends(get_current_facilitator)):
+    return await record_scan(data.qr_code, "boarding")
 
 @app.post("/meals")
-def meals_qr(data: QRData, _=Depends(get_current_facilitator)):
-    email = extract_email_from_qr(data.qr_code)
-    pres = supabase.table("participants").select("participant_id","full_name").eq("email", email).execute()
-    participant = pres.data[0] if pres.data else None
-    if not participant:
-        raise HTTPException(status_code=404, detail="Participant not found")
-
-    supabase.table("participants").update({
-        "meal_status": True,
-        "meal_timestamp": datetime.utcnow().isoformat()
-    }).eq("participant_id", participant["participant_id"]).execute()
-    log_attendance(participant["participant_id"], "meal")
-
-    return {"message": f"{participant['full_name']} collected a meal."}
+async def meals_qr(data: QRData, _=Depends(get_current_facilitator)):
+    return await record_scan(data.qr_code, "meal")
+
+# ---------------- Batched Scans ----------------
+MAX_BATCH_SCANS = int(os.getenv("MAX_BATCH_SCANS", "500"))
+
+async def resolve_participants(keys: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], dict]:
+    """Resolves ("participant_id", id) / ("email", lowercased email) keys: roster cache first, one select per key kind for the misses."""
+    found, missing = {}, {}
+    for key, value in keys:
+        participant = roster.get_by_id(value) if key == "participant_id" else roster.get_by_email(value)
+        if participant:
+            found[(key, value)] = participant
+        else:
+            missing.setdefault(key, []).append(value)
+    for key, values in missing.items():
+        pres = await async_supabase.table("participants").select("*").in_(key, values).execute()
+        for participant in pres.data or []:
+            roster.upsert(participant)
+            found[("participant_id", participant["participant_id"])] = participant
+            if participant.get("email"):
+                found[("email", participant["email"].lower())] = participant
+    return found
+
+@app.post("/scans/batch")
+async def scans_batch(data: ScanBatch, _=Depends(get_current_facilitator)):
+    """
+    Replays scans queued on a facilitator device while it was offline.
+    Costs at most one participants select and one mark_scans call per event type (supabase/schema.sql);
+    the attendance_logs rows go through the spool.
+    """
+    if len(data.scans) > MAX_BATCH_SCANS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_SCANS} scans per batch")
+
+    now = datetime.now(timezone.utc)
+    results = [None] * len(data.scans)
+    keys = {}
+    for i, scan in enumerate(data.scans):
+        try:
+            key, value = parse_scan_code(scan.qr_code)
+            keys[i] = (key, value.lower() if key == "email" else value)
+        except HTTPException as e:
+            results[i] = {"index": i, "ok": False, "status": e.status_code, "detail": e.detail}
+
+    found = await resolve_participants(set(keys.values()))
+
+    accepted = {}  # event_type -> [(index, participant, scanned_at)]
+    for i, key in keys.items():
+        participant = found.get(key)
+        if not participant:
+            results[i] = {"index": i, "ok": False, "status": 404, "detail": "Participant not found"}
+            continue
+        scan = data.scans[i]
+        accepted.setdefault(scan.event_type, []).append((i, participant, as_utc(scan.scanned_at) if scan.scanned_at else now))
+
+    duplicates = 0
+    for event_type, scans in list(accepted.items()):
+        # in scan order, so a device's queue replays the same way however it was batched
+        scans.sort(key=lambda s: s[2])
+        kept = []
+        for i, participant, ts in scans:
+            previous = scan_guard.claim(event_type, participant["participant_id"], ts)
+            if not previous:
+                kept.append((i, participant, ts))
+                continue
+            duplicates += 1
+            try:
+                results[i] = {"index": i, "ok": True, "status": 200, **duplicate_scan(event_type, participant, previous)}
+            except HTTPException as e:
+                results[i] = {"index": i, "ok": False, "status": e.status_code, "duplicate": True, "detail": e.detail}
+        if kept:
+            accepted[event_type] = kept
+        else:
+            del accepted[event_type]
+
+    logs = []
+    for event_type, scans in accepted.items():
+        status_col, ts_col, suffix = SCAN_EVENTS[event_type]
+        # per-scan times are kept in attendance_logs; each participant row gets its own latest one
+        latest = {}
+        for _, participant, ts in scans:
+            pid = participant["participant_id"]
+            latest[pid] = max(latest.get(pid, ts), ts)
+        try:
+            res = await async_supabase.rpc("mark_scans", {
+                "p_event_type": event_type,
+                "p_scans": [{"participant_id": pid, "scanned_at": ts.isoformat()} for pid, ts in latest.items()],
+            }).execute()
+        except Exception as e:
+            for i, participant, ts in scans:
+                scan_guard.release(event_type, participant["participant_id"], ts)
+                results[i] = {"index": i, "ok": False, "status": 502, "detail": f"Update failed: {e}"}
+            continue
+        updated = {row["participant_id"] for row in res.data or []}
+        for pid, ts in latest.items():
+            if pid in updated:
+                roster.patch(pid, {status_col: True, ts_col: ts.isoformat()})
+            else:
+                # deleted since the roster cached it: no log row either, it would break the foreign key
+                roster.invalidate(participant_id=pid)
+        for i, participant, ts in scans:
+            if participant["participant_id"] not in updated:
+                scan_guard.release(event_type, participant["participant_id"], ts)
+                results[i] = {"index": i, "ok": False, "status": 404, "detail": "Participant not found"}
+                continue
+            logs.append({
+                "participant_id": participant["participant_id"],
+                "event_type": event_type,
+                "status": True,
+                "timestamp": ts.isoformat()
+            })
+            results[i] = {"index": i, "ok": True, "status": 200,
+                          "message": f"{participant['full_name']} {suffix}"}
+            scan_recorded(event_type, participant["participant_id"], participant.get("full_name"), ts.isoformat())
+
+    # open + write + fsync (and possibly waiting on another worker's file lock): keep it off the event loop
+    with stage("log_attendance"):
+        await run_in_threadpool(attendance_spool.append, logs)
+
+    return {
+        "processed": len(results),
+        "accepted": sum(1 for r in results if r["ok"] and not r.get("duplicate")),
+        "duplicates": duplicates,
+        "results": results,
+    }
+
+# ---------------- Live Dashboard ----------------
+@app.get("/live/attendance")
+async def live_attendance(_=Depends(get_current_facilitator)):
+    return live.snapshot()
+
+@app.post("/live/attendance/stream-token")
+async def live_attendance_stream_token(current=Depends(get_current_facilitator)):
+    """Short-lived token that only opens the live feed; it goes in the feed URL instead of the login token."""
+    return {"stream_token": create_stream_token(current), "expires_in": STREAM_TOKEN_SECONDS}
+
+@app.get("/live/attendance/stream")
+async def live_attendance_stream(token: str = Query(...)):
+    """Server-sent events feed of the running totals. EventSource cannot send headers, so a stream token comes as ?token=."""
+    await get_stream_viewer(token)
+    return StreamingResponse(live.stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# ---------------- Analytics ----------------
+@app.get("/analytics/attendance")
+async def attendance_analytics(bucket_minutes: float = Query(5, gt=0), since: Optional[datetime] = None,
+                               until: Optional[datetime] = None, _=Depends(get_current_facilitator)):
+    """Scans per event type per time bucket, the busiest bucket per event type and the check-in/boarding/meal funnel."""
+    return rollups.report(int(bucket_minutes * 60), since, until)
+
+@app.post("/analytics/rebuild", status_code=202)
+async def rebuild_analytics(_=Depends(get_current_facilitator)):
+    if rollups.rebuilding:
+        return {"message": "Rebuild already running."}
+    app.state.rollup_rebuild = asyncio.create_task(rebuild_rollups())
+    return {"message": "Rebuilding analytics from attendance_logs."}
+
+# ---------------- Metrics ----------------
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")  # when set, scrapers must send it as a bearer token
+
+registry.gauge("ticket_render_queue_depth", "Ticket renders waiting on or running in the render pool.", renderer.queue_depth)
+registry.gauge("password_hash_inflight", "bcrypt jobs admitted to the password hasher.", lambda: password_hasher.inflight)
+registry.counter("password_hash_rejected_total", "bcrypt jobs refused because the hasher was full.",
+                 lambda: password_hasher.rejected)
+registry.gauge("attendance_spool_pending_bytes", "Bytes of attendance_logs rows spooled locally, not yet flushed.",
+               attendance_spool.pending_bytes)
+registry.counter("attendance_spool_flushed_total", "attendance_logs rows flushed from the spool.",
+                 lambda: attendance_spool.flushed)
+registry.gauge("smtp_idle_connections", "Open SMTP connections waiting in the pool.", lambda: mailer.stats()["idle"])
+registry.counter("smtp_sent_total", "Emails sent.", lambda: mailer.sent)
+registry.gauge("roster_participants", "Participants held in the roster cache.", lambda: roster.stats()["participants"])
+registry.counter("token_cache_lookups_total", "Facilitator token lookups by cache result.",
+                 lambda: {("hit",): token_cache.hits, ("miss",): token_cache.misses}, ("result",))
+registry.counter("scan_duplicates_total", "Scans stopped by the duplicate/meal-quota guard.",
+                 lambda: {(e,): n for e, n in scan_guard.stats()["duplicates"].items()}, ("event_type",))
+registry.gauge("live_viewers", "Open live dashboard streams.", lambda: live.viewers)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics(authorization: Optional[str] = Header(None)):
+    """Prometheus text format: request and stage latency histograms, Supabase call timings and queue depths."""
+    if METRICS_TOKEN and authorization != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
 # ---------------- DEV / DEBUG ----------------
 @app.post("/dev/create_facilitator")
-def dev_create_facilitator(email: EmailStr, password: str):
-    password_hash = pwd_context.hash(password)
-    supabase.table("profiles").insert({
+async def dev_create_facilitator(email: EmailStr, password: str):
+    password_hash = await hash_password(password)
+    await async_supabase.table("profiles").insert({
         "email": email,
         "role": "facilitator",
         "password_hash": password_hash
@@ -264,9 +656,9 @@ def dev_create_facilitator(email: EmailStr, password: str):
     return {"ok": True}
 
 @app.get("/health")
-def health():
+async def health():
     return {"ok": True, "time": datetime.utcnow().isoformat()}
 
 @app.get("/")
-def root():
+async def root():
     return {"message": "API is running"}
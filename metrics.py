@@ -0,0 +1,167 @@
+# metrics.py
+# Prometheus text exposition without the prometheus_client dependency; observations are a bisect and a counter
+# bump under a lock.
+import os, time, bisect, threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Tuple, Union
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+# seconds: a cached scan answers in about a millisecond, an SMTP send or a cold ticket render takes seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Iterable[str], values: Iterable, extra: Iterable[Tuple[str, str]] = ()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _number(value: float) -> str:
+    return "+Inf" if value == float("inf") else f"{value:g}"
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram; one series per combination of label values."""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series: Dict[tuple, list] = {}  # label values -> [per-bucket counts (last is +Inf), sum]
+
+    def observe(self, value: float, *labels):
+        if not METRICS_ENABLED:
+            return
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, counts, total in sorted(series):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, [('le', _number(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Sampled:
+    """
+    Gauge or counter read from the app's own state at scrape time, e.g. a queue depth.
+    fn returns a number, or {label values tuple: number} when labelnames are given.
+    """
+
+    def __init__(self, name: str, help: str, kind: str, fn: Callable[[], Union[float, Dict[tuple, float]]],
+                 labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+
+    def render(self) -> List[str]:
+        try:
+            value = self.fn()
+        except Exception as e:
+            return [f"# {self.name} unavailable: {_escape(e)}"]
+        values = value if isinstance(value, dict) else {(): value}
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labels, v in sorted(values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(float(v or 0))}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Union[Histogram, Sampled]] = {}
+
+    def histogram(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._metrics.setdefault(name, Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name: str, help: str, fn: Callable, labelnames: Tuple[str, ...] = ()) -> Sampled:
+        self._metrics[name] = Sampled(name, help, "gauge", fn, labelnames)
+        return self._metrics[name]
+
+    def counter(self, name: str, help: str, fn: Callable, labelnames: Tuple[str, ...] = ()) -> Sampled:
+        self._metrics[name] = Sampled(name, help, "counter", fn, labelnames)
+        return self._metrics[name]
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUEST_SECONDS = registry.histogram(
+    "http_request_duration_seconds", "Time from request to response headers, by route template.", ("method", "route", "status"))
+STAGE_SECONDS = registry.histogram(
+    "stage_duration_seconds", "Time spent in one step of request handling or background work.", ("stage",))
+SUPABASE_SECONDS = registry.histogram(
+    "supabase_request_duration_seconds", "Supabase HTTP calls including the response body, by table and operation.",
+    ("table", "operation", "status"))
+
+
+def stage(name: str):
+    """with stage("jwt_decode"): ... -- times the block into stage_duration_seconds."""
+    return STAGE_SECONDS.time(name)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing each HTTP request until its response headers are sent, so a stream counts its
+    setup rather than its lifetime. Labelled by route template (/tickets/{email}), never by raw path.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        observed = False
+
+        def observe(status: int):
+            nonlocal observed
+            observed = True
+            route = scope.get("route")
+            REQUEST_SECONDS.observe(time.perf_counter() - start, scope["method"],
+                                    getattr(route, "path", "unmatched"), str(status))
+
+        async def timed_send(message):
+            if message["type"] == "http.response.start":
+                observe(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            if not observed:
+                observe(500)
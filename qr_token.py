@@ -0,0 +1,106 @@
+# qr_token.py
+# Signed QR payloads for tickets.
+#
+# Token layout (fits the pinned QR version for ticket codes):
+#     T1|<participant_id>|<role>|<event>|<expiry, unix seconds in base 36>|<signature>
+# signature = first 10 bytes of HMAC-SHA256(QR_SIGNING_KEY, everything before the last "|"), base64url.
+import os, hmac, time, base64, hashlib
+from datetime import date, datetime, timezone
+from typing import Optional, Dict, Any
+from dotenv import load_dotenv
+
+load_dotenv()
+QR_SIGNING_KEY = (os.getenv("QR_SIGNING_KEY") or os.getenv("SECRET_KEY", "change_me_in_prod")).encode("utf-8")
+QR_EVENT_CODE = os.getenv("EVENT_CODE", "HACK25")
+QR_TOKEN_TTL_DAYS = int(os.getenv("QR_TOKEN_TTL_DAYS", "30"))
+QR_TOKEN_EXPIRES = os.getenv("QR_TOKEN_EXPIRES")  # ISO date/time; overrides EVENT_DATE and the TTL
+# old name|email|type|code tickets carry no signature, so anyone can forge one: off unless a migration needs it
+QR_ACCEPT_LEGACY = os.getenv("QR_ACCEPT_LEGACY", "0") == "1"
+
+TOKEN_PREFIX = "T1"
+SIGNATURE_BYTES = 10
+
+
+class InvalidQRToken(ValueError):
+    """reason is one of "format", "signature", "expired", "event"."""
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+def _b36(n: int) -> str:
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    out = ""
+    while True:
+        n, r = divmod(n, 36)
+        out = digits[r] + out
+        if not n:
+            return out
+
+
+def _sign(body: str, key: bytes) -> str:
+    mac = hmac.new(key, body.encode("utf-8"), hashlib.sha256).digest()[:SIGNATURE_BYTES]
+    return base64.urlsafe_b64encode(mac).rstrip(b"=").decode("ascii")
+
+
+def _event_day(value: Optional[str]) -> Optional[int]:
+    """EVENT_DATE as days since the epoch, or None when it is unset or not an ISO date (e.g. "TBD")."""
+    try:
+        return (datetime.fromisoformat(value.strip()).date() - date(1970, 1, 1)).days if value else None
+    except ValueError:
+        return None
+
+
+EVENT_DAY = _event_day(os.getenv("EVENT_DATE"))
+
+
+def default_expiry(now: Optional[float] = None) -> int:
+    # a whole-day boundary, so every ticket rendered on the same day carries the same token
+    if QR_TOKEN_EXPIRES:
+        expires = datetime.fromisoformat(QR_TOKEN_EXPIRES)
+        return int((expires if expires.tzinfo else expires.replace(tzinfo=timezone.utc)).timestamp())
+    if EVENT_DAY is not None:
+        # valid through the day after the event (UTC)
+        return (EVENT_DAY + 2) * 86400
+    day = int((time.time() if now is None else now) // 86400)
+    return (day + 1 + QR_TOKEN_TTL_DAYS) * 86400
+
+
+def is_signed_token(qr_code: str) -> bool:
+    return qr_code.startswith(TOKEN_PREFIX + "|")
+
+
+def sign_qr_token(participant_id: str, role: str, event: str = QR_EVENT_CODE, expires_at: Optional[float] = None,
+                  key: bytes = QR_SIGNING_KEY) -> str:
+    if expires_at is None:
+        expires_at = default_expiry()
+    fields = (participant_id, role.lower(), event)
+    if any("|" in f for f in fields):
+        raise ValueError("token fields cannot contain '|'")
+    body = "|".join((TOKEN_PREFIX,) + fields + (_b36(int(expires_at)),))
+    return f"{body}|{_sign(body, key)}"
+
+
+def verify_qr_token(token: str, event: Optional[str] = QR_EVENT_CODE, now: Optional[float] = None,
+                    key: bytes = QR_SIGNING_KEY) -> Dict[str, Any]:
+    """
+    Checks signature, expiry and event using only the token and the key; raises InvalidQRToken.
+    Returns {"participant_id", "role", "event", "expires_at"}. Pass event=None to accept any event.
+    """
+    body, _, signature = token.strip().rpartition("|")
+    parts = body.split("|")
+    if len(parts) != 5 or parts[0] != TOKEN_PREFIX or not signature:
+        raise InvalidQRToken("format", "Not a signed ticket code")
+    if not hmac.compare_digest(signature, _sign(body, key)):
+        raise InvalidQRToken("signature", "Ticket code signature does not match")
+    _, participant_id, role, token_event, expiry = parts
+    try:
+        expires_at = int(expiry, 36)
+    except ValueError:
+        raise InvalidQRToken("format", "Bad expiry in ticket code")
+    if expires_at < (time.time() if now is None else now):
+        raise InvalidQRToken("expired", "Ticket code has expired")
+    if event is not None and token_event != event:
+        raise InvalidQRToken("event", f"Ticket is for event {token_event}, not {event}")
+    return {"participant_id": participant_id, "role": role, "event": token_event, "expires_at": expires_at}
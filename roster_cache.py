@@ -0,0 +1,338 @@
+# roster_cache.py
+import os, time, uuid, threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Dict, Any, List, Tuple
+
+ROSTER_REFRESH_SECONDS = int(os.getenv("ROSTER_REFRESH_SECONDS", "60"))
+ROSTER_PAGE_SIZE = int(os.getenv("ROSTER_PAGE_SIZE", "1000"))
+# deltas cannot see deleted rows; a full re-read this often drops them
+ROSTER_FULL_REFRESH_SECONDS = int(os.getenv("ROSTER_FULL_REFRESH_SECONDS", "900"))
+# re-read this much before the newest updated_at seen, for transactions that committed late
+ROSTER_DELTA_OVERLAP_SECONDS = int(os.getenv("ROSTER_DELTA_OVERLAP_SECONDS", "30"))
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+UNIQUE_KEYS = {"participants": "participant_id", "tickets": "id"}
+
+# what scanner devices get per participant in /roster/snapshot
+SNAPSHOT_COLUMNS = ("participant_id", "email", "full_name", "role", "checkin_status", "transport_status", "meal_status")
+
+
+def _norm_email(email: Optional[str]) -> str:
+    return (email or "").strip().lower()
+
+
+def _view(row: Dict[str, Any]) -> tuple:
+    return tuple(row.get(c) for c in SNAPSHOT_COLUMNS)
+
+
+class RosterCache:
+    """
+    In-memory index of the participants table keyed by email, participant_id and ticket_uuid.
+    Lookups never touch the network; callers read through to Supabase on a miss and upsert() the row.
+
+    Refreshes read only rows whose updated_at (kept by a trigger, see supabase/schema.sql) moved since the last
+    one; a full re-read runs at start, every full_refresh_seconds and whenever the table has no updated_at.
+
+    Every change to a participant's SNAPSHOT_COLUMNS bumps a sequence number, so snapshot(since=version) can
+    return only what changed. Versions are "<epoch>.<seq>"; the epoch is new for every process, so a version
+    from another process or an earlier run gets a full snapshot instead of a wrong delta.
+    """
+
+    def __init__(self, client, page_size: int = ROSTER_PAGE_SIZE, refresh_seconds: int = ROSTER_REFRESH_SECONDS,
+                 full_refresh_seconds: int = ROSTER_FULL_REFRESH_SECONDS):
+        self._client = client
+        self.page_size = page_size
+        self.refresh_seconds = refresh_seconds
+        self.full_refresh_seconds = full_refresh_seconds
+        self._lock = threading.Lock()
+        # one refresh at a time: a second caller waits for the running one instead of starting its own
+        self._refresh_lock = threading.Lock()
+        # table -> newest updated_at seen; None when the table has no updated_at column
+        self._watermarks: Dict[str, Optional[datetime]] = {}
+        self._last_full = 0.0
+        self._by_id: Dict[str, Dict[str, Any]] = {}
+        self._by_email: Dict[str, str] = {}
+        self._by_ticket: Dict[str, str] = {}
+        # writes that land while a refresh is in flight, re-applied on top of the fresh snapshot
+        self._pending: Optional[Dict[str, Dict[str, Any]]] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.warmed = False
+        self.last_refresh: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+        self.epoch = uuid.uuid4().hex[:8]
+        self._seq = 0
+        # participant_id -> (seq of its latest change, removed?), oldest change first
+        self._changes: "OrderedDict[str, Tuple[int, bool]]" = OrderedDict()
+
+    # ---------------- Lookups ----------------
+    def get_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            pid = self._by_email.get(_norm_email(email))
+            return self._hit(pid)
+
+    def get_by_id(self, participant_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._hit(participant_id)
+
+    def get_by_ticket(self, ticket_uuid: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._hit(self._by_ticket.get(ticket_uuid))
+
+    def _hit(self, pid: Optional[str]) -> Optional[Dict[str, Any]]:
+        row = self._by_id.get(pid) if pid else None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return dict(row)
+
+    def select(self, **equals: Optional[str]) -> List[Dict[str, Any]]:
+        """Copies of every participant whose columns match, case-insensitively; None values do not filter."""
+        wanted = {k: str(v).lower() for k, v in equals.items() if v is not None}
+        with self._lock:
+            return [dict(row) for row in self._by_id.values()
+                    if all(str(row.get(k) or "").lower() == v for k, v in wanted.items())]
+
+    # ---------------- Writes ----------------
+    def upsert(self, row: Dict[str, Any], ticket_uuid: Optional[str] = None):
+        pid = row.get("participant_id")
+        if not pid:
+            return
+        with self._lock:
+            self._put(row)
+            if ticket_uuid:
+                self._by_ticket[ticket_uuid] = pid
+
+    def patch(self, participant_id: str, fields: Dict[str, Any]):
+        with self._lock:
+            row = self._by_id.get(participant_id)
+            if row is not None:
+                before = _view(row)
+                row.update(fields)
+                if _view(row) != before:
+                    self._bump(participant_id)
+                if self._pending is not None:
+                    self._pending[participant_id] = dict(row)
+
+    def invalidate(self, email: Optional[str] = None, participant_id: Optional[str] = None):
+        with self._lock:
+            pid = participant_id or self._by_email.get(_norm_email(email))
+            row = self._by_id.pop(pid, None) if pid else None
+            if row is not None:
+                self._by_email.pop(_norm_email(row.get("email")), None)
+                # gone from the map the next full refresh diffs against, so report the removal now;
+                # a read-through that finds the row again bumps it back in
+                self._bump(pid, removed=True)
+                if self._pending is not None:
+                    self._pending.pop(pid, None)
+            if email:
+                self._by_email.pop(_norm_email(email), None)
+            if pid:
+                self._by_ticket = {t: p for t, p in self._by_ticket.items() if p != pid}
+
+    def _put(self, row: Dict[str, Any]):
+        pid = row["participant_id"]
+        old = self._by_id.get(pid)
+        if old is not None and _norm_email(old.get("email")) != _norm_email(row.get("email")):
+            self._by_email.pop(_norm_email(old.get("email")), None)
+        self._by_id[pid] = dict(row)
+        if old is None or _view(old) != _view(row):
+            self._bump(pid)
+        if self._pending is not None:
+            self._pending[pid] = dict(row)
+        if row.get("email"):
+            self._by_email[_norm_email(row["email"])] = pid
+
+    def _bump(self, pid: str, removed: bool = False):
+        self._seq += 1
+        self._changes[pid] = (self._seq, removed)
+        self._changes.move_to_end(pid)
+
+    # ---------------- Snapshots ----------------
+    @property
+    def version(self) -> str:
+        return f"{self.epoch}.{self._seq}"
+
+    def _since_seq(self, since: Optional[str]) -> Optional[int]:
+        epoch, _, seq = (since or "").partition(".")
+        if epoch != self.epoch or not seq.isdigit() or int(seq) > self._seq:
+            return None
+        return int(seq)
+
+    def snapshot(self, since: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Compact export for scanner devices: rows are lists in SNAPSHOT_COLUMNS order.
+        With a since version from this process only rows changed after it are returned, plus the ids that
+        disappeared; otherwise (or when full is true in the result) the client replaces its whole copy.
+        """
+        with self._lock:
+            seq = self._since_seq(since)
+            rows, removed = [], []
+            if seq is None:
+                rows = [[row.get(c) for c in SNAPSHOT_COLUMNS] for row in self._by_id.values()]
+            else:
+                for pid in reversed(self._changes):
+                    changed_at, gone = self._changes[pid]
+                    if changed_at <= seq:
+                        break
+                    row = self._by_id.get(pid)
+                    if gone:
+                        removed.append(pid)
+                    elif row is not None:
+                        rows.append([row.get(c) for c in SNAPSHOT_COLUMNS])
+            return {
+                "version": self.version,
+                "full": seq is None,
+                "columns": list(SNAPSHOT_COLUMNS),
+                "rows": rows,
+                "removed": removed,
+            }
+
+    # ---------------- Loading ----------------
+    def _fetch_all(self, table: str, columns: str, since: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        # offset paging is only stable over a total order: scans keep rewriting participants rows mid-read,
+        # and a bulk insert gives many rows the same updated_at
+        key = UNIQUE_KEYS[table]
+        rows, start = [], 0
+        while True:
+            query = self._client.table(table).select(columns)
+            if since is not None:
+                query = query.gte("updated_at", since.isoformat()).order("updated_at")
+            res = query.order(key).range(start, start + self.page_size - 1).execute()
+            batch = res.data or []
+            rows.extend(batch)
+            if len(batch) < self.page_size:
+                return rows
+            start += self.page_size
+
+    @staticmethod
+    def _newest(rows: List[Dict[str, Any]], current: Optional[datetime] = None) -> Optional[datetime]:
+        # an empty table gives no evidence either way: try deltas, a missing column makes the delta query fail
+        if not rows:
+            return current or EPOCH
+        stamps = [datetime.fromisoformat(r["updated_at"]) for r in rows if r.get("updated_at")]
+        if not stamps:
+            return None
+        return max(stamps + ([current] if current else []))
+
+    def _since(self, table: str) -> Optional[datetime]:
+        mark = self._watermarks.get(table)
+        return mark - timedelta(seconds=ROSTER_DELTA_OVERLAP_SECONDS) if mark else None
+
+    def refresh(self, full: bool = False):
+        """Brings the index up to date: a delta read when possible, otherwise a full one (see the class docstring)."""
+        if not self._refresh_lock.acquire(blocking=False):
+            with self._refresh_lock:
+                return
+        try:
+            since = {t: self._since(t) for t in ("participants", "tickets")}
+            due = time.monotonic() - self._last_full >= self.full_refresh_seconds
+            if full or due or not self.warmed or None in since.values():
+                self._refresh_full()
+            else:
+                try:
+                    self._refresh_changed(since)
+                except Exception as e:
+                    print(f"[roster] delta refresh failed, re-reading everything: {e}")
+                    self._refresh_full()
+        finally:
+            self._refresh_lock.release()
+
+    def _refresh_full(self):
+        with self._lock:
+            self._pending = {}
+        try:
+            participants = self._fetch_all("participants", "*")
+            tickets = self._fetch_all("tickets", "*")
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+
+        by_id = {p["participant_id"]: dict(p) for p in participants if p.get("participant_id")}
+        by_email = {_norm_email(p.get("email")): pid for pid, p in by_id.items() if p.get("email")}
+        by_ticket = {t["ticket_uuid"]: t["participant_id"] for t in tickets
+                     if t.get("ticket_uuid") and t.get("participant_id") in by_id}
+
+        with self._lock:
+            pending, self._pending = self._pending or {}, None
+            old = self._by_id
+            self._by_id, self._by_email, self._by_ticket = by_id, by_email, by_ticket
+            for pid, row in by_id.items():
+                if pid not in old or _view(old[pid]) != _view(row):
+                    self._bump(pid)
+            for pid in old.keys() - by_id.keys():
+                self._bump(pid, removed=True)
+            for row in pending.values():
+                self._put(row)
+            self._watermarks = {"participants": self._newest(participants), "tickets": self._newest(tickets)}
+            self._last_full = time.monotonic()
+            self.warmed = True
+            self.last_refresh = datetime.utcnow().isoformat()
+
+    def _refresh_changed(self, since: Dict[str, datetime]):
+        with self._lock:
+            self._pending = {}
+        try:
+            participants = self._fetch_all("participants", "*", since["participants"])
+            tickets = self._fetch_all("tickets", "*", since["tickets"])
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+
+        with self._lock:
+            pending, self._pending = self._pending or {}, None
+            for row in participants:
+                if row.get("participant_id"):
+                    self._put(row)
+            for t in tickets:
+                if t.get("ticket_uuid") and t.get("participant_id") in self._by_id:
+                    self._by_ticket[t["ticket_uuid"]] = t["participant_id"]
+            # writes made through this process while the delta was in flight are at least as new
+            for row in pending.values():
+                self._put(row)
+            self._watermarks["participants"] = self._newest(participants, self._watermarks.get("participants"))
+            self._watermarks["tickets"] = self._newest(tickets, self._watermarks.get("tickets"))
+            self.last_refresh = datetime.utcnow().isoformat()
+
+    def warm(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f"[roster] warm-up failed, falling back to read-through: {e}")
+
+    def start(self):
+        self.warm()
+        if self.refresh_seconds <= 0 or self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._refresh_loop, name="roster-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self.refresh_seconds):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"[roster] refresh failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "participants": len(self._by_id),
+                "tickets": len(self._by_ticket),
+                "hits": self.hits,
+                "misses": self.misses,
+                "warmed": self.warmed,
+                "last_refresh": self.last_refresh,
+                "incremental": bool(self._watermarks) and None not in self._watermarks.values(),
+                "version": self.version,
+            }
@@ -0,0 +1,83 @@
+# scan_guard.py
+import os, bisect, threading
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, Iterable, List, Tuple, Union
+
+SCAN_REENTRY_SECONDS = float(os.getenv("SCAN_REENTRY_SECONDS", "300"))
+MEAL_QUOTA = int(os.getenv("MEAL_QUOTA", "1"))
+MEAL_WINDOW_SECONDS = float(os.getenv("MEAL_WINDOW_SECONDS", str(3 * 3600)))
+
+# event_type -> (scans allowed, per this many seconds)
+DEFAULT_SCAN_RULES = {
+    "checkin": (1, SCAN_REENTRY_SECONDS),
+    "boarding": (1, SCAN_REENTRY_SECONDS),
+    "meal": (MEAL_QUOTA, MEAL_WINDOW_SECONDS),
+}
+
+
+def scan_seconds(ts: Union[str, datetime, None]) -> float:
+    if ts is None:
+        return datetime.now(timezone.utc).timestamp()
+    if isinstance(ts, str):
+        ts = datetime.fromisoformat(ts)
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.timestamp()
+
+
+class ScanGuard:
+    """
+    Remembers accepted scan times per (event type, participant) so repeat scans are caught before any write.
+    claim() either reserves the scan (returns None) or returns the earlier scan times that make it a duplicate:
+    each event type allows `quota` scans per participant within any `window` seconds.
+    Claims are taken before the write, so two phones scanning the same ticket at once cannot both get through;
+    release() gives a claim back when the write fails. State is per process.
+    """
+
+    def __init__(self, rules: Dict[str, Tuple[int, float]] = None):
+        self.rules = dict(rules or DEFAULT_SCAN_RULES)
+        self._lock = threading.Lock()
+        self._times: Dict[Tuple[str, str], List[float]] = {}  # sorted accepted scan times
+        self.duplicates: Dict[str, int] = {e: 0 for e in self.rules}
+
+    def seed(self, participants: Iterable[Dict[str, Any]], timestamp_columns: Dict[str, str]):
+        """Last scan times from rows already loaded (the roster cache), so a restart does not forget recent scans."""
+        with self._lock:
+            for row in participants:
+                for event_type, column in timestamp_columns.items():
+                    if row.get(column):
+                        self._insert((event_type, row["participant_id"]), scan_seconds(row[column]))
+
+    def claim(self, event_type: str, participant_id: str, at: Union[str, datetime, None] = None) -> Optional[List[str]]:
+        quota, window = self.rules.get(event_type, (0, 0))
+        key, t = (event_type, participant_id), scan_seconds(at)
+        with self._lock:
+            times = self._times.get(key, [])
+            if quota > 0 and window > 0:
+                near = times[bisect.bisect_right(times, t - window):bisect.bisect_left(times, t + window)]
+                if len(near) >= quota:
+                    self.duplicates[event_type] = self.duplicates.get(event_type, 0) + 1
+                    return [datetime.fromtimestamp(s, timezone.utc).isoformat() for s in near]
+            self._insert(key, t, window)
+        return None
+
+    def release(self, event_type: str, participant_id: str, at: Union[str, datetime, None] = None):
+        key, t = (event_type, participant_id), scan_seconds(at)
+        with self._lock:
+            times = self._times.get(key)
+            if times and t in times:
+                times.remove(t)
+
+    def _insert(self, key: Tuple[str, str], t: float, window: float = None):
+        times = self._times.setdefault(key, [])
+        bisect.insort(times, t)
+        # only times within a window of the newest can still block a scan; bounds memory per participant
+        window = self.rules.get(key[0], (0, 0))[1] if window is None else window
+        cutoff = bisect.bisect_left(times, times[-1] - 2 * window)
+        if cutoff:
+            del times[:cutoff]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"tracked": len(self._times), "duplicates": dict(self.duplicates),
+                    "rules": {e: {"quota": q, "window_seconds": w} for e, (q, w) in self.rules.items()}}
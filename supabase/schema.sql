@@ -0,0 +1,193 @@
+-- supabase/schema.sql
+-- Tables used by main.py, backend/ and the scripts, plus the scan procedure called through supabase.rpc.
+
+create extension if not exists pgcrypto;
+
+-- ---------------- Facilitators ----------------
+create table if not exists public.profiles (
+  id            uuid primary key default gen_random_uuid(),
+  email         text not null,
+  role          text not null default 'facilitator',
+  password_hash text,
+  created_at    timestamptz not null default now(),
+  unique (email, role)
+);
+
+-- ---------------- Participants ----------------
+create table if not exists public.participants (
+  id                  bigint generated by default as identity primary key,
+  participant_id      text not null unique,
+  full_name           text,
+  email               text unique,
+  student_number      text,
+  role                text not null default 'participant',
+  year_of_study       int,
+  registration_status text,
+  confirmation_status text,
+  admission_status    text,
+  qr_code_url         text,
+  checkin_status      boolean not null default false,
+  checkin_timestamp   timestamptz,
+  transport_status    boolean not null default false,
+  transport_timestamp timestamptz,
+  meal_status         boolean not null default false,
+  meal_timestamp      timestamptz,
+  created_at          timestamptz not null default now()
+);
+
+create table if not exists public.tickets (
+  id             uuid primary key default gen_random_uuid(),
+  participant_id text not null references public.participants (participant_id) on delete cascade,
+  ticket_uuid    uuid unique default gen_random_uuid(),
+  pdf_path       text,
+  file_url       text,
+  render_status  text not null default 'ready' check (render_status in ('pending', 'ready', 'failed')),
+  issued_at      timestamptz not null default now()
+);
+
+-- databases created before background rendering
+alter table public.tickets add column if not exists render_status text not null default 'ready'
+  check (render_status in ('pending', 'ready', 'failed'));
+
+create index if not exists tickets_participant_id_idx on public.tickets (participant_id);
+
+-- updated_at lets the API's roster cache re-read only rows that changed (roster_cache.py).
+-- "add column if not exists" so applying this file to an existing database migrates it.
+alter table public.participants add column if not exists updated_at timestamptz not null default now();
+alter table public.tickets      add column if not exists updated_at timestamptz not null default now();
+
+create or replace function public.set_updated_at()
+returns trigger
+language plpgsql
+as $$
+begin
+  new.updated_at := now();
+  return new;
+end;
+$$;
+
+drop trigger if exists participants_set_updated_at on public.participants;
+create trigger participants_set_updated_at before update on public.participants
+  for each row execute function public.set_updated_at();
+
+drop trigger if exists tickets_set_updated_at on public.tickets;
+create trigger tickets_set_updated_at before update on public.tickets
+  for each row execute function public.set_updated_at();
+
+create index if not exists participants_updated_at_idx on public.participants (updated_at);
+create index if not exists tickets_updated_at_idx on public.tickets (updated_at);
+
+-- ---------------- Attendance ----------------
+create table if not exists public.attendance_logs (
+  id             bigint generated by default as identity primary key,
+  event_id       uuid unique,  -- set by the API's write-behind spool so replayed rows are not inserted twice
+  participant_id text not null references public.participants (participant_id) on delete cascade,
+  event_type     text not null check (event_type in ('checkin', 'boarding', 'meal')),
+  status         boolean not null default true,
+  "timestamp"    timestamptz not null default now()
+);
+
+-- databases created before the spool: add the column and its unique index in place
+alter table public.attendance_logs add column if not exists event_id uuid;
+create unique index if not exists attendance_logs_event_id_key on public.attendance_logs (event_id);
+
+create index if not exists attendance_logs_participant_id_idx on public.attendance_logs (participant_id);
+create index if not exists attendance_logs_timestamp_idx on public.attendance_logs ("timestamp");
+
+-- ---------------- Scan procedure ----------------
+-- Looks the participant up (by participant_id when given, otherwise by email), sets the status flag
+-- for the event, appends the attendance log and returns the participant, all in one transaction.
+-- Returns no rows when the participant does not exist.
+create or replace function public.record_scan(
+  p_event_type     text,
+  p_email          text default null,
+  p_participant_id text default null,
+  p_scanned_at     timestamptz default now()
+)
+returns table (participant_id text, full_name text)
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  v_pid  text;
+  v_name text;
+begin
+  if p_event_type = 'checkin' then
+    update participants p
+       set checkin_status = true, checkin_timestamp = p_scanned_at
+     where (p_participant_id is not null and p.participant_id = p_participant_id)
+        or (p_participant_id is null and p.email = p_email)
+    returning p.participant_id, p.full_name into v_pid, v_name;
+  elsif p_event_type = 'boarding' then
+    update participants p
+       set transport_status = true, transport_timestamp = p_scanned_at
+     where (p_participant_id is not null and p.participant_id = p_participant_id)
+        or (p_participant_id is null and p.email = p_email)
+    returning p.participant_id, p.full_name into v_pid, v_name;
+  elsif p_event_type = 'meal' then
+    update participants p
+       set meal_status = true, meal_timestamp = p_scanned_at
+     where (p_participant_id is not null and p.participant_id = p_participant_id)
+        or (p_participant_id is null and p.email = p_email)
+    returning p.participant_id, p.full_name into v_pid, v_name;
+  else
+    raise exception 'unknown event type: %', p_event_type using errcode = '22023';
+  end if;
+
+  if v_pid is null then
+    return;
+  end if;
+
+  insert into attendance_logs (participant_id, event_type, status, "timestamp")
+  values (v_pid, p_event_type, true, p_scanned_at);
+
+  return query select v_pid, v_name;
+end;
+$$;
+
+revoke all on function public.record_scan(text, text, text, timestamptz) from public, anon;
+grant execute on function public.record_scan(text, text, text, timestamptz) to service_role;
+
+-- ---------------- Batch scan procedure ----------------
+-- Marks many participants for one event type in one statement (POST /scans/batch). p_scans is a JSON array of
+-- {"participant_id", "scanned_at"}; each participant gets the latest of its own scan times, never an older one than
+-- it already has. Returns the participant_ids that exist, so the caller can report the rest as not found.
+create or replace function public.mark_scans(
+  p_event_type text,
+  p_scans      jsonb
+)
+returns table (participant_id text)
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+  if p_event_type not in ('checkin', 'boarding', 'meal') then
+    raise exception 'unknown event type: %', p_event_type using errcode = '22023';
+  end if;
+
+  return query
+  with s as (
+    select x.participant_id, max(x.scanned_at) as scanned_at
+      from jsonb_to_recordset(p_scans) as x(participant_id text, scanned_at timestamptz)
+     group by x.participant_id
+  )
+  update participants p
+     set checkin_status      = p.checkin_status or p_event_type = 'checkin',
+         checkin_timestamp   = case when p_event_type = 'checkin'
+                                    then greatest(p.checkin_timestamp, s.scanned_at) else p.checkin_timestamp end,
+         transport_status    = p.transport_status or p_event_type = 'boarding',
+         transport_timestamp = case when p_event_type = 'boarding'
+                                    then greatest(p.transport_timestamp, s.scanned_at) else p.transport_timestamp end,
+         meal_status         = p.meal_status or p_event_type = 'meal',
+         meal_timestamp      = case when p_event_type = 'meal'
+                                    then greatest(p.meal_timestamp, s.scanned_at) else p.meal_timestamp end
+    from s
+   where p.participant_id = s.participant_id
+  returning p.participant_id;
+end;
+$$;
+
+revoke all on function public.mark_scans(text, jsonb) from public, anon;
+grant execute on function public.mark_scans(text, jsonb) to service_role;
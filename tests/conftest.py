@@ -0,0 +1,173 @@
+# tests/conftest.py
+# In-memory stand-in for the supabase-py / postgrest query builders the API uses, so the tests run without Supabase.
+import os, sys, copy, tempfile
+import pytest
+
+os.environ.setdefault("SUPABASE_URL", "http://supabase.test")
+os.environ.setdefault("SUPABASE_KEY", "test-service-key")
+os.environ.setdefault("ATTENDANCE_SPOOL_PATH", os.path.join(tempfile.mkdtemp(prefix="spool-"), "attendance.jsonl"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SCAN_COLUMNS = {
+    "checkin": ("checkin_status", "checkin_timestamp"),
+    "boarding": ("transport_status", "transport_timestamp"),
+    "meal": ("meal_status", "meal_timestamp"),
+}
+
+
+class Result:
+    def __init__(self, data):
+        self.data = data
+
+
+class Query:
+    def __init__(self, db: "FakeDB", table: str):
+        self.db, self.table = db, table
+        self.op, self.payload, self.kw, self.filters, self.window = "select", None, {}, [], None
+        self.orders = []
+
+    def select(self, *columns, **kw):
+        self.op = "select"
+        return self
+
+    def insert(self, payload, **kw):
+        self.op, self.payload, self.kw = "insert", payload, kw
+        return self
+
+    def upsert(self, payload, **kw):
+        self.op, self.payload, self.kw = "upsert", payload, kw
+        return self
+
+    def update(self, payload):
+        self.op, self.payload = "update", payload
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda r: r.get(column) == value)
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self.filters.append(lambda r: r.get(column) in values)
+        return self
+
+    def gte(self, column, value):
+        self.filters.append(lambda r: r.get(column) is not None and r.get(column) >= value)
+        return self
+
+    def order(self, column, desc=False, **kw):
+        self.orders.append((column, desc))
+        return self
+
+    def range(self, start, end):
+        self.window = (start, end + 1)
+        return self
+
+    def execute(self):
+        self.db.calls.append((self.table, self.op))
+        self.db.check(self.table, self.op, self.payload)
+        rows = self.db.tables.setdefault(self.table, [])
+        matched = [r for r in rows if all(f(r) for f in self.filters)]
+        if self.op == "select":
+            self.db.selects.append((self.table, list(self.orders)))
+            for column, desc in reversed(self.orders):
+                matched = sorted(matched, key=lambda r: (r.get(column) is None, r.get(column)), reverse=desc)
+            return Result(copy.deepcopy(matched[slice(*self.window)] if self.window else matched))
+        if self.op == "update":
+            for r in matched:
+                r.update(self.payload)
+            return Result(copy.deepcopy(matched))
+        payload = self.payload if isinstance(self.payload, list) else [self.payload]
+        key = self.kw.get("on_conflict")
+        out = []
+        for row in payload:
+            if key and any(r.get(key) == row.get(key) for r in rows):
+                continue
+            rows.append(dict(row))
+            out.append(dict(row))
+        return Result(out)
+
+
+class AsyncQuery(Query):
+    async def execute(self):
+        return Query.execute(self)
+
+
+class FakeDB:
+    """
+    Tables are lists of dicts. fail[(table, op)] = callable(payload) -> exception or None makes that call
+    raise whatever the callable returns.
+    """
+
+    def __init__(self):
+        self.tables = {"participants": [], "tickets": [], "attendance_logs": []}
+        self.calls = []
+        self.selects = []  # (table, [(column, desc), ...]) per select, in call order
+        self.fail = {}
+
+    def table(self, name):
+        return Query(self, name)
+
+    def check(self, name, op, payload):
+        error = self.fail[(name, op)](payload) if (name, op) in self.fail else None
+        if error is not None:
+            raise error
+
+    def rpc(self, name, params):
+        db = self
+
+        class Call:
+            def execute(self):
+                db.calls.append((name, "rpc"))
+                db.check(name, "rpc", params)
+                return Result(getattr(db, name)(**params))
+
+        return Call()
+
+    def mark_scans(self, p_event_type, p_scans):
+        status_col, ts_col = SCAN_COLUMNS[p_event_type]
+        found = []
+        for scan in p_scans:
+            for row in self.tables["participants"]:
+                if row["participant_id"] == scan["participant_id"]:
+                    row[status_col] = True
+                    row[ts_col] = max(filter(None, (row.get(ts_col), scan["scanned_at"])))
+                    found.append({"participant_id": row["participant_id"]})
+        return found
+
+
+class AsyncFakeDB:
+    def __init__(self, db: FakeDB):
+        self.db = db
+
+    def table(self, name):
+        return AsyncQuery(self.db, name)
+
+    def rpc(self, name, params):
+        call = self.db.rpc(name, params)
+
+        class Call:
+            async def execute(self):
+                return call.execute()
+
+        return Call()
+
+
+@pytest.fixture
+def db():
+    return FakeDB()
+
+
+@pytest.fixture
+def app_client(db, monkeypatch):
+    """TestClient for main.app over the fake database, signed in as a facilitator. The lifespan does not run."""
+    import main
+    from fastapi.testclient import TestClient
+    from dependencies import get_current_facilitator
+    from roster_cache import RosterCache
+
+    monkeypatch.setattr(main, "async_supabase", AsyncFakeDB(db))
+    monkeypatch.setattr(main, "roster", RosterCache(db, refresh_seconds=0))
+    main.app.dependency_overrides[get_current_facilitator] = lambda: {"sub": "f@example.com", "role": "facilitator"}
+    yield TestClient(main.app)
+    main.app.dependency_overrides.clear()
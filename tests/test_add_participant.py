@@ -0,0 +1,46 @@
+# tests/test_add_participant.py
+import pytest
+
+import main
+from ticket_render import RenderQueueFull
+
+
+class FullRenderer:
+    """Room for one more job when checked, gone by the time it is submitted."""
+
+    def full(self):
+        return False
+
+    def submit(self, participant_id, *fields, on_done=None):
+        raise RenderQueueFull("queue filled up")
+
+
+@pytest.fixture
+def api(app_client, db, monkeypatch):
+    renderer = FullRenderer()
+    monkeypatch.setattr(main, "renderer", renderer)
+    return app_client, db, renderer
+
+
+def test_full_render_queue_still_accepts_the_participant(api):
+    client, db, renderer = api
+    res = client.post("/participants", json={"name": "Ann", "email": "ann@example.com"})
+    assert res.status_code == 202
+    body = res.json()
+    assert body["ticket_status"] == "failed"
+    assert body["render_url"] == "/tickets/ann@example.com/render"
+    assert [p["email"] for p in db.tables["participants"]] == ["ann@example.com"]
+    assert db.tables["tickets"][0]["render_status"] == "failed"
+
+
+def test_requeue_marks_the_ticket_pending(api, monkeypatch):
+    client, db, renderer = api
+    client.post("/participants", json={"name": "Ann", "email": "ann@example.com"})
+
+    queued = []
+    monkeypatch.setattr(main.renderer, "submit", lambda pid, *fields, on_done=None: queued.append((pid, fields)))
+    res = client.post("/tickets/ann@example.com/render")
+    assert res.status_code == 202 and res.json()["ticket_status"] == "pending"
+    assert queued[0][1][:2] == ("Ann", "ann@example.com")
+    assert db.tables["tickets"][0]["render_status"] == "pending"
+    assert client.post("/tickets/nobody@example.com/render").status_code == 404
@@ -0,0 +1,144 @@
+# tests/test_attendance_spool.py
+import json
+import threading
+import asyncio
+import pytest
+
+from conftest import AsyncFakeDB
+import attendance_spool
+from attendance_spool import AttendanceSpool
+
+
+class Rejected(Exception):
+    """What postgrest raises for a row the database refuses: a SQLSTATE code."""
+
+    def __init__(self, code="23503"):
+        super().__init__(f"error {code}")
+        self.code = code
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def rows(*pids, event_type="checkin"):
+    return [{"participant_id": pid, "event_type": event_type, "status": True, "timestamp": "2025-03-01T08:00:00+00:00"}
+            for pid in pids]
+
+
+@pytest.fixture
+def spool(tmp_path):
+    return AttendanceSpool(str(tmp_path / "attendance.jsonl"), batch_size=3, fsync=False)
+
+
+def logged(db):
+    return sorted(r["participant_id"] for r in db.tables["attendance_logs"])
+
+
+def test_flush_commits_and_starts_the_spool_over(db, spool):
+    spool.append(rows("p1", "p2"))
+    spool.append(rows("p3")[0])
+    spool.append(rows("p4", "p5"))
+    run(spool.flush_all(AsyncFakeDB(db)))
+    assert logged(db) == ["p1", "p2", "p3", "p4", "p5"]
+    assert spool.pending_bytes() == 0 and spool.flushed == 5
+    assert open(spool.path, "rb").read() == b""
+
+
+def test_unflushed_rows_are_replayed_by_the_next_process(db, spool):
+    spool.append(rows("p1", "p2"))
+    with open(spool.path, "ab") as f:
+        f.write(b'{"participant_id": "half-writ')  # crash mid-append
+
+    again = AttendanceSpool(spool.path, fsync=False)
+    again._recover()
+    run(again.flush_all(AsyncFakeDB(db)))
+    assert logged(db) == ["p1", "p2"]
+    assert again.pending_bytes() == 0
+
+
+def test_replay_after_an_uncommitted_insert_does_not_duplicate(db, spool):
+    spool.append(rows("p1", "p2"))
+    client = AsyncFakeDB(db)
+    offset, end, batch = spool._read_batch()
+    run(client.table("attendance_logs").upsert(batch, on_conflict="event_id").execute())  # insert landed, commit did not
+
+    run(spool.flush_all(client))
+    assert logged(db) == ["p1", "p2"]
+
+
+def test_rejected_rows_are_dead_lettered_and_the_rest_flushed(db, spool):
+    db.fail[("attendance_logs", "upsert")] = lambda payload: (
+        Rejected() if any(r["participant_id"] == "gone" for r in (payload if isinstance(payload, list) else [payload])) else None)
+    spool.append(rows("p1", "gone", "p2"))
+    spool.append(rows("p3"))
+
+    run(spool.flush_all(AsyncFakeDB(db)))
+    assert logged(db) == ["p1", "p2", "p3"]
+    assert spool.pending_bytes() == 0 and spool.stats()["dead_lettered"] == 1
+    with open(spool.dead_path) as f:
+        dead = [json.loads(line) for line in f]
+    assert [d["row"]["participant_id"] for d in dead] == ["gone"]
+    assert "23503" in dead[0]["error"]
+
+
+def test_outages_keep_the_rows_for_the_next_flush(db, spool):
+    spool.append(rows("p1", "p2"))
+    db.fail[("attendance_logs", "upsert")] = lambda payload: ConnectionError("connection refused")
+    with pytest.raises(ConnectionError):
+        run(spool.flush_all(AsyncFakeDB(db)))
+    assert spool.pending_bytes() > 0 and logged(db) == []
+
+    del db.fail[("attendance_logs", "upsert")]
+    run(spool.flush_all(AsyncFakeDB(db)))
+    assert logged(db) == ["p1", "p2"] and spool.pending_bytes() == 0
+
+
+def test_one_worker_flushes_at_a_time(db, spool):
+    other = AttendanceSpool(spool.path, fsync=False)  # a second API worker process on the same spool
+    spool.append(rows("p1"))
+    with spool._flusher() as mine:
+        assert mine
+        assert run(other.flush_all(AsyncFakeDB(db))) is None and logged(db) == []
+    run(other.flush_all(AsyncFakeDB(db)))
+    assert logged(db) == ["p1"]
+
+
+def test_rows_appended_during_a_flush_are_kept(db, spool):
+    other = AttendanceSpool(spool.path, fsync=False)
+    spool.append(rows("p1", "p2"))
+    appended = []
+
+    def append_mid_insert(payload):
+        if not appended:
+            appended.append(True)
+            other.append(rows("p3"))
+
+    db.fail[("attendance_logs", "upsert")] = append_mid_insert
+    run(spool.flush_all(AsyncFakeDB(db)))
+    assert logged(db) == ["p1", "p2"] and spool.pending_bytes() > 0
+    run(spool.flush_all(AsyncFakeDB(db)))
+    assert logged(db) == ["p1", "p2", "p3"] and spool.pending_bytes() == 0
+
+
+def test_commit_does_not_truncate_rows_another_worker_appends(db, spool, monkeypatch):
+    other = AttendanceSpool(spool.path, fsync=False)
+    spool.append(rows("p1"))
+    getsize = attendance_spool.os.path.getsize
+    appender = []
+
+    def getsize_then_let_another_worker_append(path):
+        size = getsize(path)
+        if not appender:
+            # another worker appends between the size check and the truncate; the file lock holds it off
+            appender.append(threading.Thread(target=other.append, args=(rows("p2"),)))
+            appender[0].start()
+            appender[0].join(0.2)
+        return size
+
+    monkeypatch.setattr(attendance_spool.os.path, "getsize", getsize_then_let_another_worker_append)
+    run(spool.flush_once(AsyncFakeDB(db)))
+    appender[0].join()
+    monkeypatch.undo()
+    run(spool.flush_all(AsyncFakeDB(db)))
+    assert logged(db) == ["p1", "p2"]
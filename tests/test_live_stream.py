@@ -0,0 +1,37 @@
+# tests/test_live_stream.py
+import asyncio
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import main
+from dependencies import create_access_token, get_stream_viewer
+
+
+@pytest.fixture
+def client():
+    return TestClient(main.app)
+
+
+def bearer(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_stream_token_opens_only_the_feed(client):
+    login = create_access_token({"sub": "f@example.com", "role": "facilitator"})
+    res = client.post("/live/attendance/stream-token", headers=bearer(login))
+    assert res.status_code == 200
+    stream_token = res.json()["stream_token"]
+
+    assert asyncio.run(get_stream_viewer(stream_token))["sub"] == "f@example.com"
+    # useless as a login token if it leaks from an access log
+    assert client.get("/live/attendance", headers=bearer(stream_token)).status_code == 401
+    assert client.post("/live/attendance/stream-token", headers=bearer(stream_token)).status_code == 401
+
+
+def test_feed_refuses_login_tokens(client):
+    login = create_access_token({"sub": "f@example.com", "role": "facilitator"})
+    assert client.get("/live/attendance/stream", params={"token": login}).status_code == 401
+    with pytest.raises(HTTPException):
+        asyncio.run(get_stream_viewer("not-a-token"))
+    assert client.post("/live/attendance/stream-token").status_code == 401
@@ -0,0 +1,29 @@
+# tests/test_print_run.py
+import sys
+import pytest
+
+from backend.services.pdf_service import render_print_run
+
+TICKETS = [(f"Participant {i}", f"{i:08d}", f"T1|p{i}|participant|HACK25|zz|sig") for i in range(20)]
+
+
+def test_parts_are_joined_into_one_pdf(tmp_path):
+    pypdf = pytest.importorskip("pypdf")
+    out = tmp_path / "run.pdf"
+    result = render_print_run(TICKETS, str(out), workers=2, chunk_pages=1, cols=2, rows=2)
+    assert result["files"] == [str(out)] and result["pages"] == 5
+    assert len(pypdf.PdfReader(str(out)).pages) == 5
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["run.pdf"]
+
+
+def test_missing_pypdf_fails_before_rendering(tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "pypdf", None)  # makes the import raise ImportError
+    with pytest.raises(RuntimeError, match="pypdf"):
+        render_print_run(TICKETS, str(tmp_path / "run.pdf"), workers=1, chunk_pages=1, cols=2, rows=2)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_one_part_needs_no_join(tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "pypdf", None)
+    result = render_print_run(TICKETS, str(tmp_path / "run.pdf"), chunk_pages=5, cols=2, rows=2)
+    assert result["files"] == [str(tmp_path / "run.pdf")] and result["pages"] == 5
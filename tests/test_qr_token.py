@@ -0,0 +1,30 @@
+# tests/test_qr_token.py
+from datetime import datetime, timezone
+
+import qr_token
+
+
+def at(iso: str) -> int:
+    return int(datetime.fromisoformat(iso).replace(tzinfo=timezone.utc).timestamp())
+
+
+def test_expiry_is_the_end_of_the_day_after_the_event(monkeypatch):
+    monkeypatch.setattr(qr_token, "QR_TOKEN_EXPIRES", None)
+    monkeypatch.setattr(qr_token, "EVENT_DAY", qr_token._event_day("2025-03-01"))
+    assert qr_token.default_expiry(now=at("2025-02-01T10:00:00")) == at("2025-03-03T00:00:00")
+    monkeypatch.setattr(qr_token, "EVENT_DAY", qr_token._event_day("2025-03-01T09:00:00"))
+    assert qr_token.default_expiry() == at("2025-03-03T00:00:00")
+
+
+def test_ttl_applies_without_an_event_date(monkeypatch):
+    monkeypatch.setattr(qr_token, "QR_TOKEN_EXPIRES", None)
+    monkeypatch.setattr(qr_token, "QR_TOKEN_TTL_DAYS", 30)
+    for value in (None, "", "TBD"):
+        monkeypatch.setattr(qr_token, "EVENT_DAY", qr_token._event_day(value))
+        assert qr_token.default_expiry(now=at("2025-02-01T10:00:00")) == at("2025-03-04T00:00:00")
+
+
+def test_fixed_expiry_wins(monkeypatch):
+    monkeypatch.setattr(qr_token, "QR_TOKEN_EXPIRES", "2025-05-01T00:00:00")
+    monkeypatch.setattr(qr_token, "EVENT_DAY", qr_token._event_day("2025-03-01"))
+    assert qr_token.default_expiry() == at("2025-05-01T00:00:00")
@@ -0,0 +1,50 @@
+# tests/test_resend_ticket.py
+import pytest
+
+import main
+
+
+class Renderer:
+    def __init__(self):
+        self.rendered = []
+
+    async def render_png(self, *fields):
+        self.rendered.append(fields)
+        return "etag", b"\x89PNG rendered"
+
+
+class Mailer:
+    configured = True
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, msg):
+        self.sent.append(msg)
+
+
+@pytest.fixture
+def api(app_client, db, monkeypatch):
+    db.tables["participants"] = [{"participant_id": "p1", "full_name": "Ann", "email": "ann@example.com", "role": "mentor"}]
+    db.tables["tickets"] = [{"participant_id": "p1", "pdf_path": "/nowhere/ann.png"}]
+    renderer, mailer = Renderer(), Mailer()
+    monkeypatch.setattr(main, "renderer", renderer)
+    monkeypatch.setattr(main, "mailer", mailer)
+    return app_client, renderer, mailer
+
+
+def test_resend_attaches_the_rendered_ticket(api):
+    client, renderer, mailer = api
+    res = client.post("/tickets/resend", json={"email": "ann@example.com"})
+    assert res.status_code == 200, res.text
+    assert renderer.rendered == [("Ann", "ann@example.com", "Mentor", "p1")]
+    [msg] = mailer.sent
+    [attachment] = list(msg.iter_attachments())
+    assert attachment.get_filename() == "ticket_p1.png"
+    assert attachment.get_content() == b"\x89PNG rendered"
+
+
+def test_resend_unknown_participant(api):
+    client, renderer, mailer = api
+    assert client.post("/tickets/resend", json={"email": "nobody@example.com"}).status_code == 404
+    assert mailer.sent == []
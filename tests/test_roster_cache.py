@@ -0,0 +1,67 @@
+# tests/test_roster_cache.py
+from roster_cache import RosterCache
+
+
+def seeded(db, *pids):
+    db.tables["participants"] = [{"participant_id": pid, "email": f"{pid}@example.com", "full_name": pid.upper()}
+                                 for pid in pids]
+    roster = RosterCache(db, refresh_seconds=0)
+    roster.refresh()
+    return roster
+
+
+def test_invalidate_shows_up_in_the_next_delta(db):
+    roster = seeded(db, "p1", "p2")
+    version = roster.snapshot()["version"]
+
+    roster.invalidate(participant_id="p2")
+    delta = roster.snapshot(since=version)
+    assert delta["version"] != version
+    assert not delta["full"] and delta["removed"] == ["p2"] and delta["rows"] == []
+
+
+def test_invalidate_then_full_refresh_of_a_deleted_row(db):
+    roster = seeded(db, "p1", "p2")
+    version = roster.snapshot()["version"]
+    db.tables["participants"] = [r for r in db.tables["participants"] if r["participant_id"] != "p2"]
+
+    roster.invalidate(email="P2@example.com")
+    roster.refresh(full=True)
+    assert roster.snapshot(since=version)["removed"] == ["p2"]
+
+
+def test_read_through_after_invalidate_brings_the_row_back(db):
+    roster = seeded(db, "p1")
+    version = roster.snapshot()["version"]
+
+    roster.invalidate(participant_id="p1")
+    roster.upsert(dict(db.tables["participants"][0]))
+    delta = roster.snapshot(since=version)
+    assert delta["removed"] == [] and [row[0] for row in delta["rows"]] == ["p1"]
+
+
+def test_invalidating_an_unknown_email_changes_nothing(db):
+    roster = seeded(db, "p1")
+    version = roster.snapshot()["version"]
+    roster.invalidate(email="new@example.com")
+    assert roster.snapshot()["version"] == version
+
+
+def test_every_page_is_read_in_a_total_order(db):
+    stamp = "2025-03-01T08:00:00+00:00"  # one bulk insert: every row shares updated_at
+    db.tables["participants"] = [{"participant_id": f"p{i}", "email": f"p{i}@example.com", "updated_at": stamp}
+                                 for i in (5, 1, 4, 2, 3)]
+    db.tables["tickets"] = [{"id": "t1", "participant_id": "p1", "ticket_uuid": "u1", "updated_at": stamp}]
+    roster = RosterCache(db, page_size=2, refresh_seconds=0, full_refresh_seconds=3600)
+    roster.refresh()
+    assert {table: orders for table, orders in db.selects} == {
+        "participants": [("participant_id", False)], "tickets": [("id", False)]}
+    assert roster.stats()["participants"] == 5
+
+    db.selects.clear()
+    db.tables["participants"].insert(0, {"participant_id": "p0", "email": "p0@example.com", "updated_at": stamp})
+    roster.refresh()
+    assert roster.stats()["incremental"] and roster.get_by_id("p0")
+    assert {table: orders for table, orders in db.selects} == {
+        "participants": [("updated_at", False), ("participant_id", False)],
+        "tickets": [("updated_at", False), ("id", False)]}
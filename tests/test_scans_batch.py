@@ -0,0 +1,102 @@
+# tests/test_scans_batch.py
+import json
+import pytest
+
+import main
+from attendance_spool import AttendanceSpool
+from qr_token import sign_qr_token
+from scan_guard import ScanGuard
+
+
+@pytest.fixture
+def api(app_client, db, tmp_path, monkeypatch):
+    db.tables["participants"] = [
+        {"participant_id": pid, "full_name": name, "email": f"{pid}@example.com"}
+        for pid, name in (("p1", "Ann"), ("p2", "Ben"), ("p3", "Cat"))
+    ]
+    main.roster.refresh()
+    spool = AttendanceSpool(str(tmp_path / "attendance.jsonl"))
+    monkeypatch.setattr(main, "attendance_spool", spool)
+    monkeypatch.setattr(main, "scan_guard", ScanGuard())
+    return app_client, db, spool
+
+
+def spooled(spool):
+    with open(spool.path) as f:
+        return [json.loads(line) for line in f]
+
+
+def scan(pid, event_type, scanned_at=None):
+    body = {"qr_code": sign_qr_token(pid, "participant"), "event_type": event_type}
+    if scanned_at:
+        body["scanned_at"] = scanned_at
+    return body
+
+
+def test_mixed_timezones_and_per_participant_times(api):
+    client, db, spool = api
+    res = client.post("/scans/batch", json={"scans": [
+        scan("p1", "boarding", "2025-03-01T08:00:00Z"),
+        scan("p2", "boarding", "2025-03-01T10:00:00+01:30"),  # 08:30 UTC
+        scan("p3", "boarding"),                                # arrival time, no offset from the client
+    ]})
+    assert res.status_code == 200, res.text
+    assert res.json()["accepted"] == 3
+    rows = {r["participant_id"]: r for r in db.tables["participants"]}
+    assert rows["p1"]["transport_timestamp"] == "2025-03-01T08:00:00+00:00"
+    assert rows["p2"]["transport_timestamp"] == "2025-03-01T08:30:00+00:00"
+    assert rows["p3"]["transport_status"] is True
+    assert sorted(r["participant_id"] for r in spooled(spool)) == ["p1", "p2", "p3"]
+    assert db.calls.count(("mark_scans", "rpc")) == 1
+
+
+def test_participant_deleted_since_cached_is_not_found_and_not_logged(api):
+    client, db, spool = api
+    db.tables["participants"] = [r for r in db.tables["participants"] if r["participant_id"] != "p2"]
+    res = client.post("/scans/batch", json={"scans": [scan("p1", "checkin"), scan("p2", "checkin")]}).json()
+    assert [r["status"] for r in res["results"]] == [200, 404]
+    assert [r["participant_id"] for r in spooled(spool)] == ["p1"]
+    assert main.roster.get_by_id("p2") is None
+
+
+def test_repeats_in_a_batch_are_reported_as_duplicates(api):
+    client, db, spool = api
+    res = client.post("/scans/batch", json={"scans": [
+        scan("p1", "meal", "2025-03-01T12:00:00Z"),
+        scan("p1", "meal", "2025-03-01T12:01:00Z"),
+        scan("p1", "checkin", "2025-03-01T08:00:00Z"),
+        scan("p1", "checkin", "2025-03-01T08:00:30Z"),
+    ]}).json()
+    assert res["accepted"] == 2 and res["duplicates"] == 2
+    assert res["results"][1]["status"] == 409 and res["results"][1]["duplicate"]
+    assert res["results"][3]["status"] == 200 and res["results"][3]["duplicate"]
+    assert len(spooled(spool)) == 2
+
+
+def test_failed_update_releases_the_guard(api):
+    client, db, spool = api
+    db.fail[("mark_scans", "rpc")] = lambda payload: RuntimeError("connection reset")
+    res = client.post("/scans/batch", json={"scans": [scan("p1", "checkin", "2025-03-01T08:00:00Z")]}).json()
+    assert res["results"][0]["status"] == 502
+
+    del db.fail[("mark_scans", "rpc")]
+    res = client.post("/scans/batch", json={"scans": [scan("p1", "checkin", "2025-03-01T08:00:00Z")]}).json()
+    assert res["results"][0]["status"] == 200 and not res["results"][0].get("duplicate")
+
+
+def test_bad_codes_do_not_fail_the_batch(api):
+    client, db, spool = api
+    res = client.post("/scans/batch", json={"scans": [
+        {"qr_code": "T1|p1|participant|HACK25|zzzz|forged", "event_type": "checkin"},
+        scan("nobody", "checkin"),
+        scan("p1", "checkin"),
+    ]}).json()
+    assert [r["status"] for r in res["results"]] == [400, 404, 200]
+
+
+def test_unsigned_legacy_codes_are_refused_by_default(api):
+    client, db, spool = api
+    assert main.QR_ACCEPT_LEGACY is False
+    res = client.post("/scans/batch", json={"scans": [
+        {"qr_code": "Ann|p1@example.com|Participant|HACK25", "event_type": "checkin"}]}).json()
+    assert res["results"][0]["status"] == 400
@@ -0,0 +1,119 @@
+# ticket_export.py
+# Ticket ZIP exports and print runs.
+import os, re, time, asyncio, argparse, zipfile
+from collections import deque
+from typing import Iterable, Dict, Any, AsyncIterator, Awaitable, Callable, Tuple, List
+
+from backend.services.pdf_service import ticket_pdf_bytes, render_print_run, SHEET_COLS, SHEET_ROWS, PRINT_CHUNK_PAGES
+from qr_token import sign_qr_token
+
+EXPORT_FORMATS = {"png": ("png",), "pdf": ("pdf",), "both": ("png", "pdf")}
+
+
+def render_ticket_pdf(full_name: str, student_number: str, participant_id: str, role: str) -> bytes:
+    """A4 ticket from pdf_service carrying the same signed QR token as the PNG ticket."""
+    return ticket_pdf_bytes(full_name, student_number, sign_qr_token(participant_id, role))
+
+
+def entry_name(participant: Dict[str, Any], ext: str) -> str:
+    name = re.sub(r"[^\w.-]+", "_", participant.get("full_name") or "").strip("_") or "ticket"
+    return f"{name}_{participant['participant_id']}.{ext}"
+
+
+class _ZipSink:
+    """Write-only file object for ZipFile: collects what it writes until the stream drains it."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+async def stream_ticket_zip(participants: Iterable[Dict[str, Any]],
+                            render: Callable[[Dict[str, Any], str], Awaitable[bytes]],
+                            formats: Tuple[str, ...] = ("png", "pdf"), lookahead: int = 4) -> AsyncIterator[bytes]:
+    """
+    Yields a ZIP archive of every participant's tickets piece by piece. render(participant, ext) produces one file;
+    up to lookahead files render ahead of the one being written, so memory holds only those plus the
+    central directory. PNGs are stored as they are (already compressed), PDFs are deflated.
+    A ticket that fails to render is skipped and listed in errors.txt at the end of the archive.
+    """
+    sink = _ZipSink()
+    errors = []
+    jobs = ((p, ext) for p in participants for ext in formats)
+    pending = deque()
+
+    def fill():
+        while len(pending) < lookahead:
+            job = next(jobs, None)
+            if job is None:
+                return
+            pending.append((job, asyncio.ensure_future(render(*job))))
+
+    try:
+        with zipfile.ZipFile(sink, mode="w") as zf:
+            fill()
+            while pending:
+                (participant, ext), task = pending.popleft()
+                fill()
+                try:
+                    data = await task
+                except Exception as e:
+                    errors.append(f"{entry_name(participant, ext)}: {e}")
+                    continue
+                info = zipfile.ZipInfo(entry_name(participant, ext), time.localtime()[:6])
+                info.compress_type = zipfile.ZIP_STORED if ext == "png" else zipfile.ZIP_DEFLATED
+                zf.writestr(info, data)
+                yield sink.drain()
+            if errors:
+                zf.writestr("errors.txt", "\n".join(errors) + "\n")
+        yield sink.drain()
+    finally:
+        # client went away mid-download: do not leave renders running for nobody
+        for _, task in pending:
+            task.cancel()
+
+
+# ---------------- Print runs ----------------
+def print_run_tickets(participants: Iterable[Dict[str, Any]]) -> List[Tuple[str, str, str]]:
+    """(name, student number, signed QR token) per participant, sorted by name for easier sorting at the desk."""
+    rows = sorted(participants, key=lambda p: (p.get("full_name") or "").lower())
+    return [(p.get("full_name") or "", p.get("student_number") or "",
+             sign_qr_token(p["participant_id"], p.get("role") or "participant")) for p in rows]
+
+def load_participants(role: str = None, registration_status: str = None) -> List[Dict[str, Any]]:
+    # imported here so render workers importing this module do not need Supabase credentials
+    from dependencies import supabase
+    from roster_cache import RosterCache
+    roster = RosterCache(supabase, refresh_seconds=0)
+    roster.refresh()
+    return roster.select(role=role, registration_status=registration_status)
+
+def sample_participants(count: int) -> List[Dict[str, Any]]:
+    return [{"participant_id": f"HACK25-{i:06X}", "full_name": f"Participant {i}", "student_number": f"{i:08d}",
+             "role": "participant"} for i in range(count)]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render a print run of multi-up ticket sheets")
+    parser.add_argument("--out", default=os.path.join("tickets", "print_run.pdf"))
+    parser.add_argument("--role")
+    parser.add_argument("--registration-status")
+    parser.add_argument("--cols", type=int, default=SHEET_COLS)
+    parser.add_argument("--rows", type=int, default=SHEET_ROWS)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--chunk-pages", type=int, default=PRINT_CHUNK_PAGES)
+    parser.add_argument("--sample", type=int, help="render this many made-up tickets instead of the roster (benchmark)")
+    args = parser.parse_args()
+
+    participants = sample_participants(args.sample) if args.sample else load_participants(args.role, args.registration_status)
+    print(render_print_run(print_run_tickets(participants), args.out, workers=args.workers,
+                           chunk_pages=args.chunk_pages, cols=args.cols, rows=args.rows))
@@ -0,0 +1,252 @@
+# ticket_render.py
+# Spawned render workers import this module (plus qr_token, metrics and ticket_export for the functions they run):
+# keep FastAPI and Supabase imports out of all of them.
+import os, io, time, asyncio, hashlib, argparse, multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Optional, Dict, Any, Callable, Awaitable, Set, Tuple
+from PIL import Image, ImageDraw, ImageFont
+from backend.services.qr_service import qr_image
+from qr_token import sign_qr_token, default_expiry
+from metrics import stage
+
+TICKET_RENDER_WORKERS = int(os.getenv("TICKET_RENDER_WORKERS", "2"))
+TICKET_RENDER_QUEUE = int(os.getenv("TICKET_RENDER_QUEUE", "64"))
+TICKET_CACHE_MB = int(os.getenv("TICKET_CACHE_MB", "64"))
+TICKETS_DIR = "tickets"
+
+
+# ---------------- Ticket Template ----------------
+@lru_cache(maxsize=8)
+def load_font(path: str = "arial.ttf", size: int = 24):
+    try:
+        return ImageFont.truetype(path, size=size)
+    except Exception:
+        return ImageFont.load_default()
+
+
+class TicketTemplate:
+    """
+    Everything about a ticket that is the same for the whole event, built once per process:
+    the font, a background with all static text already drawn, and where each variable field and the QR go.
+    render() only stamps in the participant's fields and QR.
+    """
+    WIDTH, HEIGHT = 600, 400
+    QR_SIZE = 200
+    LINE_X = 20
+    # (label, y) for the lines whose value changes per ticket
+    FIELDS = {"name": ("Name: ", 20), "email": ("Email: ", 60), "type": ("Type: ", 100), "code": ("Code: ", 220)}
+
+    def __init__(self, event_name: str, event_date: str, font_path: str = "arial.ttf", font_size: int = 24):
+        self.font = load_font(font_path, font_size)
+        self.qr_pos = (self.WIDTH - self.QR_SIZE - 20, self.HEIGHT - self.QR_SIZE - 20)
+
+        # black on white only, so a grayscale canvas: a third of the bytes to draw, copy and PNG-encode
+        self.background = Image.new("L", (self.WIDTH, self.HEIGHT), "white")
+        draw = ImageDraw.Draw(self.background)
+        self.value_pos = {}
+        for key, (label, y) in self.FIELDS.items():
+            draw.text((self.LINE_X, y), label, fill="black", font=self.font)
+            self.value_pos[key] = (self.LINE_X + draw.textlength(label, font=self.font), y)
+        draw.text((self.LINE_X, 140), f"Event: {event_name}", fill="black", font=self.font)
+        draw.text((self.LINE_X, 180), f"Date: {event_date}", fill="black", font=self.font)
+
+    def render(self, name: str, email: str, participant_type: str, event_code: str,
+               expires_at: Optional[int] = None) -> Image.Image:
+        # event_code is the participant's code (participant_id); the QR carries it as a signed token
+        qr_img = qr_image(sign_qr_token(event_code, participant_type, expires_at=expires_at), self.QR_SIZE)
+
+        ticket = self.background.copy()
+        draw = ImageDraw.Draw(ticket)
+        for key, value in (("name", name), ("email", email), ("type", participant_type), ("code", event_code)):
+            draw.text(self.value_pos[key], str(value), fill="black", font=self.font)
+        ticket.paste(qr_img, self.qr_pos)
+        return ticket
+
+
+@lru_cache(maxsize=4)
+def get_template(event_name: str, event_date: str) -> TicketTemplate:
+    return TicketTemplate(event_name, event_date)
+
+def current_event() -> Tuple[str, str]:
+    return os.getenv("EVENT_NAME", "NWU Hackathon"), os.getenv("EVENT_DATE", "2025-01-01")
+
+def current_template() -> TicketTemplate:
+    return get_template(*current_event())
+
+
+# ---------------- Ticket Generation ----------------
+def ticket_path(name: str, email: str) -> str:
+    safe_email = email.replace("@", "_at_")
+    return os.path.join(TICKETS_DIR, f"{name}_{safe_email}.png")
+
+def render_ticket_png(name: str, email: str, participant_type: str, event_code: str,
+                      expires_at: Optional[int] = None) -> bytes:
+    buf = io.BytesIO()
+    current_template().render(name, email, participant_type, event_code, expires_at).save(buf, format="PNG")
+    return buf.getvalue()
+
+def ticket_etag(name: str, email: str, participant_type: str, event_code: str, expires_at: int) -> str:
+    """Strong ETag over every input of a render: the same inputs always produce the same PNG bytes."""
+    parts = (name, email, participant_type, event_code, *current_event(), str(expires_at))
+    return '"' + hashlib.sha256("\x1f".join(map(str, parts)).encode("utf-8")).hexdigest()[:32] + '"'
+
+def generate_ticket(name: str, email: str, participant_type: str, event_code: str) -> str:
+    os.makedirs(TICKETS_DIR, exist_ok=True)
+    path = ticket_path(name, email)
+    current_template().render(name, email, participant_type, event_code).save(path)
+    return path
+
+
+# ---------------- Render Service ----------------
+class RenderQueueFull(Exception):
+    pass
+
+
+class TicketRenderService:
+    """
+    Renders tickets on a process pool so QR encoding and PIL drawing never run in the request thread.
+    At most queue_size renders are pending at once; submit() raises RenderQueueFull beyond that.
+    Job status ("pending", "ready", "failed") is kept per participant_id for the most recent max_jobs jobs.
+    render_png() renders on the same pool and keeps the PNG bytes in an LRU of at most cache_mb megabytes.
+    """
+
+    def __init__(self, workers: int = TICKET_RENDER_WORKERS, queue_size: int = TICKET_RENDER_QUEUE, max_jobs: int = 10000,
+                 cache_mb: int = TICKET_CACHE_MB):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.max_jobs = max_jobs
+        self.cache_bytes = cache_mb * 1024 * 1024
+        self._png: "OrderedDict[str, bytes]" = OrderedDict()
+        self._png_size = 0
+        self._rendering: Dict[str, asyncio.Future] = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._inflight = 0
+        self._tasks: Set[asyncio.Task] = set()
+        self.jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def start(self):
+        if self._pool is None:
+            # spawn, not fork: the API process already runs threads (roster refresh, threadpool)
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def full(self) -> bool:
+        return self._inflight >= self.queue_size
+
+    def queue_depth(self) -> int:
+        return self._inflight
+
+    def status(self, participant_id: str) -> Optional[Dict[str, Any]]:
+        job = self.jobs.get(participant_id)
+        return dict(job) if job else None
+
+    def _set(self, participant_id: str, job: Dict[str, Any]):
+        self.jobs[participant_id] = job
+        self.jobs.move_to_end(participant_id)
+        while len(self.jobs) > self.max_jobs:
+            self.jobs.popitem(last=False)
+
+    def submit(self, participant_id: str, name: str, email: str, participant_type: str, event_code: str,
+               on_done: Optional[Callable[[str, Dict[str, Any]], Awaitable[None]]] = None) -> asyncio.Task:
+        if self.full():
+            raise RenderQueueFull(f"{self._inflight} tickets already waiting to render")
+        self.start()
+        self._inflight += 1
+        self._set(participant_id, {"status": "pending", "path": ticket_path(name, email)})
+        task = asyncio.create_task(self._run(participant_id, (name, email, participant_type, event_code), on_done))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _cache_png(self, etag: str, data: bytes):
+        if len(data) > self.cache_bytes:
+            return
+        self._png[etag] = data
+        self._png_size += len(data)
+        while self._png_size > self.cache_bytes:
+            self._png_size -= len(self._png.popitem(last=False)[1])
+
+    def etag(self, name: str, email: str, participant_type: str, event_code: str) -> str:
+        return ticket_etag(name, email, participant_type, event_code, default_expiry())
+
+    async def render_png(self, name: str, email: str, participant_type: str, event_code: str) -> Tuple[str, bytes]:
+        """(etag, PNG bytes) for a ticket, rendered on the pool only when not cached; concurrent requests share a render."""
+        expires_at = default_expiry()
+        etag = ticket_etag(name, email, participant_type, event_code, expires_at)
+        data = self._png.get(etag)
+        if data is not None:
+            self._png.move_to_end(etag)
+            self.cache_hits += 1
+            return etag, data
+        if etag in self._rendering:
+            return etag, await asyncio.shield(self._rendering[etag])
+        if self.full():
+            raise RenderQueueFull(f"{self._inflight} tickets already waiting to render")
+        self.cache_misses += 1
+        self.start()
+        self._inflight += 1
+        future = asyncio.get_running_loop().run_in_executor(
+            self._pool, render_ticket_png, name, email, participant_type, event_code, expires_at)
+        self._rendering[etag] = future
+        try:
+            with stage("ticket_render"):
+                data = await asyncio.shield(future)
+        finally:
+            self._inflight -= 1
+            self._rendering.pop(etag, None)
+        self._cache_png(etag, data)
+        return etag, data
+
+    async def run(self, fn: Callable, *args):
+        """Runs a picklable function on the render pool without caching, e.g. for bulk exports."""
+        self.start()
+        self._inflight += 1
+        try:
+            with stage("ticket_render"):
+                return await asyncio.get_running_loop().run_in_executor(self._pool, fn, *args)
+        finally:
+            self._inflight -= 1
+
+    def cache_stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._png), "bytes": self._png_size, "hits": self.cache_hits, "misses": self.cache_misses}
+
+    async def _run(self, participant_id: str, args: tuple, on_done):
+        loop = asyncio.get_running_loop()
+        try:
+            with stage("ticket_render"):
+                path = await loop.run_in_executor(self._pool, generate_ticket, *args)
+            job = {"status": "ready", "path": path}
+        except Exception as e:
+            job = {"status": "failed", "error": str(e)}
+        finally:
+            self._inflight -= 1
+        self._set(participant_id, job)
+        if on_done:
+            try:
+                await on_done(participant_id, dict(job))
+            except Exception as e:
+                print(f"[render] post-render step failed for {participant_id}: {e}")
+
+
+# ---------------- Benchmark ----------------
+def benchmark(count: int = 500) -> dict:
+    """Renders count tickets to PNG bytes on this core; the first (template-building) render is not timed."""
+    render_ticket_png("Warm Up", "warm@up.test", "Participant", "WARMUP")
+    start = time.perf_counter()
+    for i in range(count):
+        render_ticket_png(f"Participant {i}", f"{i:08d}@mynwu.ac.za", "Participant", f"HACK25-{i:06X}")
+    elapsed = time.perf_counter() - start
+    return {"tickets": count, "seconds": round(elapsed, 3), "tickets_per_second_per_core": round(count / elapsed, 1)}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure ticket rendering throughput")
+    parser.add_argument("--count", type=int, default=500)
+    print(benchmark(parser.parse_args().count))